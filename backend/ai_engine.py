@@ -1,22 +1,124 @@
 from backend.models import GameState, Move
 from backend.game_engine import GameEngine
+from backend.pn_search import ProofNumberSearch, WIN
+from backend import metrics
+from typing import List, Optional, Tuple
+import os
 import random
-import copy
+import time
+
+# AI_PN_NODES: node budget of the proof-number pre-pass (0 disables it)
+# AI_PN_MAX_GOATS_IN_HAND: run the pre-pass once at most this many goats are left to place
+AI_PN_NODES = int(os.environ.get("AI_PN_NODES", "1000"))
+AI_PN_MAX_GOATS_IN_HAND = int(os.environ.get("AI_PN_MAX_GOATS_IN_HAND", "4"))
+# AI_EVAL: leaf evaluation, "handwritten" or "learned" (see backend/value_model.py)
+# AI_EVAL_WEIGHTS: weights file for the learned evaluation (defaults to the shipped version)
+AI_EVAL = os.environ.get("AI_EVAL", "handwritten")
+AI_EVAL_WEIGHTS = os.environ.get("AI_EVAL_WEIGHTS")
+
+EVALUATIONS = ("handwritten", "learned")
+# Fail at startup rather than on the first AI move, where the error would
+# surface as a rejected player move.
+if AI_EVAL not in EVALUATIONS:
+    raise ValueError(f"AI_EVAL must be one of {', '.join(EVALUATIONS)}, got {AI_EVAL!r}")
+if AI_EVAL == "learned":
+    # Same for a missing or mismatched weights file; load_value_model caches it
+    from backend.value_model import DEFAULT_WEIGHTS, load_value_model
+    load_value_model(AI_EVAL_WEIGHTS or DEFAULT_WEIGHTS)
+
+class SearchTimeout(Exception):
+    """Raised by minimax when the search runs past AIEngine.deadline."""
 
 class AIEngine:
-    def __init__(self):
-        pass
+    def __init__(self, evaluation: Optional[str] = None, rng: Optional[random.Random] = None):
+        # Breaks ties between equally scored moves; pass a seeded Random for reproducible play
+        self.rng = rng or random.Random()
+        # Per-search counters, reset by get_best_move
+        self.nodes = 0
+        # perf_counter() time after which minimax raises SearchTimeout
+        self.deadline: Optional[float] = None
+        self.last_search_seconds = 0.0
+        self.solver = ProofNumberSearch(max_nodes=AI_PN_NODES) if AI_PN_NODES > 0 else None
+        # Learned value network; None uses the hand-written evaluate_state
+        self.value_model = None
+        evaluation = evaluation or AI_EVAL
+        if evaluation == "learned":
+            # NumPy is only needed for the learned evaluation
+            from backend.value_model import DEFAULT_WEIGHTS, load_value_model
+            self.value_model = load_value_model(AI_EVAL_WEIGHTS or DEFAULT_WEIGHTS)
+        elif evaluation not in EVALUATIONS:
+            raise ValueError(f"Unknown AI evaluation {evaluation!r}")
 
-    def get_best_move(self, state: GameState) -> Move:
-        player = state.activePlayer
-        depth = 2  # Depth can be adjusted for difficulty
-        
+    def get_best_move(self, state: GameState, depth: int = 2, time_budget_ms: Optional[float] = None,
+                      prove: bool = True) -> Move:
+        """
+        Pick a move for the side to move. A forced win found by the
+        proof-number pre-pass is played directly (`prove=False` skips it).
+        Otherwise, with a time budget, a depth-1 answer is computed first and
+        returned if the full search runs out of time. The pre-pass may use at
+        most half the budget.
+        """
+        self.nodes = 0
+
+        start = time.perf_counter()
+        with metrics.maybe_profile("ai_search"):
+            best_move = None
+            if prove:
+                prove_deadline = None if time_budget_ms is None else start + time_budget_ms / 2000
+                best_move = self._prove_win(state, prove_deadline)
+            if best_move is None:
+                best_move = self._search_within_budget(state, depth, start, time_budget_ms)
+        self.last_search_seconds = time.perf_counter() - start
+        metrics.record_ai_search(self.last_search_seconds, self.nodes)
+        return best_move
+
+    def _prove_win(self, state: GameState, deadline: Optional[float] = None) -> Optional[Move]:
+        """Look for a forced win in the late placement and movement phases."""
+        if self.solver is None or state.phase == "GAME_OVER" or state.goatsInHand > AI_PN_MAX_GOATS_IN_HAND:
+            return None
+        result = self.solver.solve(state, deadline=deadline)
+        self.nodes += result.nodes
+        return result.move if result.status == WIN else None
+
+    def _search_within_budget(self, state: GameState, depth: int, start: float, time_budget_ms: Optional[float]) -> Move:
+        if time_budget_ms is None:
+            return self._search(state, depth)
+
+        best_move = None
+        self.deadline = start + time_budget_ms / 1000
+        try:
+            best_move = self._search(state, 1)
+            if depth > 1:
+                best_move = self._search(state, depth)
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+        if best_move is None:
+            # Out of time before even the depth-1 search finished
+            moves = GameEngine(state=state).get_valid_moves(state.activePlayer)
+            best_move = self.rng.choice(moves) if moves else None
+        return best_move
+
+    def _search(self, state: GameState, depth: int = 2) -> Move:
         best_score = float('-inf')
         best_move = None
-        
-        # Create a simulation engine
-        # Use model_copy if pydantic v2, or copy if v1. 
-        # To be safe with lists, we ensure deep copy.
+
+        for move, score in self.score_moves(state, depth, shuffle=True):
+            if score > best_score:
+                best_score = score
+                best_move = move
+                
+        return best_move
+
+    def score_moves(self, state: GameState, depth: int, shuffle: bool = False) -> List[Tuple[Move, float]]:
+        """
+        Score every legal move for the side to move, from that side's point
+        of view, searching `depth` plies including the move itself.
+        """
+        player = state.activePlayer
+
+        # One copy per search; nodes below are visited with apply_move/undo_move
         try:
             sim_state = state.model_copy(deep=True)
         except AttributeError:
@@ -24,77 +126,98 @@ class AIEngine:
 
         sim_engine = GameEngine(state=sim_state)
         valid_moves = sim_engine.get_valid_moves(player)
-        
-        if not valid_moves:
-            return None
 
-        random.shuffle(valid_moves)
+        if shuffle:
+            self.rng.shuffle(valid_moves)
 
-        for move in valid_moves:
-            try:
-                next_state = sim_state.model_copy(deep=True) if hasattr(sim_state, 'model_copy') else sim_state.copy(deep=True)
-            except Exception:
-                 # Fallback for deep copy if pydantic fails
-                next_state = copy.deepcopy(sim_state)
+        if depth == 1 and self.value_model is not None:
+            children = self._child_states(sim_engine, valid_moves)
+            scores = self._leaf_scores([child for _, child in children], player)
+            return [(move, score) for (move, _), score in zip(children, scores)]
 
-            temp_engine = GameEngine(state=next_state)
+        scored = []
+        for move in valid_moves:
             try:
-                temp_engine.apply_move(move)
-                score = self.minimax(next_state, depth - 1, False, player)
-                
-                if score > best_score:
-                    best_score = score
-                    best_move = move
+                sim_engine.apply_move(move)
             except ValueError:
                 continue
-                
-        return best_move
+            try:
+                scored.append((move, self.minimax(sim_engine, depth - 1, False, player)))
+            finally:
+                sim_engine.undo_move()
 
-    def minimax(self, state: GameState, depth: int, is_maximizing: bool, ai_player: str) -> float:
+        return scored
+
+    def minimax(self, engine: GameEngine, depth: int, is_maximizing: bool, ai_player: str) -> float:
+        """Score engine.state; the engine is left as it was found."""
+        self.nodes += 1
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        return self._minimax(engine, depth, is_maximizing, ai_player)
+
+    def _minimax(self, engine: GameEngine, depth: int, is_maximizing: bool, ai_player: str) -> float:
+        state = engine.state
         if depth == 0 or state.phase == "GAME_OVER":
             return self.evaluate_state(state, ai_player)
 
-        sim_engine = GameEngine(state=state)
         current_player = state.activePlayer
-        valid_moves = sim_engine.get_valid_moves(current_player)
+        valid_moves = engine.get_valid_moves(current_player)
 
         if not valid_moves:
             return self.evaluate_state(state, ai_player)
 
-        if is_maximizing:
-            max_eval = float('-inf')
-            for move in valid_moves:
-                try:
-                    next_state = state.model_copy(deep=True) if hasattr(state, 'model_copy') else state.copy(deep=True)
-                except:
-                    next_state = copy.deepcopy(state)
-
-                temp_engine = GameEngine(state=next_state)
-                try:
-                    temp_engine.apply_move(move)
-                    eval = self.minimax(next_state, depth - 1, False, ai_player)
-                    max_eval = max(max_eval, eval)
-                except:
-                    continue
-            return max_eval
-        else:
-            min_eval = float('inf')
-            for move in valid_moves:
-                try:
-                    next_state = state.model_copy(deep=True) if hasattr(state, 'model_copy') else state.copy(deep=True)
-                except:
-                    next_state = copy.deepcopy(state)
-
-                temp_engine = GameEngine(state=next_state)
-                try:
-                    temp_engine.apply_move(move)
-                    eval = self.minimax(next_state, depth - 1, True, ai_player)
-                    min_eval = min(min_eval, eval)
-                except:
-                    continue
-            return min_eval
+        if depth == 1 and self.value_model is not None:
+            # Score all leaves below this node with one batched call
+            scores = self._leaf_scores([child for _, child in self._child_states(engine, valid_moves)], ai_player)
+            if not scores:
+                return float('-inf') if is_maximizing else float('inf')
+            return max(scores) if is_maximizing else min(scores)
+
+        best = float('-inf') if is_maximizing else float('inf')
+        for move in valid_moves:
+            try:
+                engine.apply_move(move)
+            except ValueError:
+                continue
+            try:
+                eval = self.minimax(engine, depth - 1, not is_maximizing, ai_player)
+            finally:
+                engine.undo_move()
+            best = max(best, eval) if is_maximizing else min(best, eval)
+        return best
+
+    def _child_states(self, engine: GameEngine, moves: List[Move]) -> List[Tuple[Move, GameState]]:
+        """
+        The position after each legal move in `moves`. Children share the
+        parent's history list, which leaf evaluation does not read.
+        """
+        children = []
+        for move in moves:
+            try:
+                engine.apply_move(move)
+            except ValueError:
+                continue
+            state = engine.state
+            try:
+                child = state.model_copy(update={"board": list(state.board)})
+            except AttributeError:
+                child = state.copy(update={"board": list(state.board)})
+            engine.undo_move()
+            children.append((move, child))
+        return children
+
+    def _leaf_scores(self, states: List[GameState], ai_player: str) -> List[float]:
+        """Learned evaluation of a whole set of leaves; each leaf counts as a node."""
+        self.nodes += len(states)
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        return self.value_model.evaluate_states(states, ai_player)
 
     def evaluate_state(self, state: GameState, ai_player: str) -> float:
+        if self.value_model is not None:
+            return self.value_model.evaluate_states([state], ai_player)[0]
+
         if state.winner:
             if state.winner == ai_player:
                 return 10000
@@ -0,0 +1,208 @@
+"""
+Admission control and fair scheduling for AI moves.
+
+AI searches are CPU-bound, so running one per request on the event loop lets
+a burst of vs-AI games slow everyone down together. The scheduler runs at
+most AI_CPU_BUDGET searches at a time on a process pool, serves matches
+round-robin so one busy match can't starve the others, and sheds load when
+requests pile up: past AI_SHED_QUEUE_DEPTH waiting requests, searches run
+at a shallower depth and a tighter time budget, without the proof-number
+pre-pass. The queue itself is bounded: a request that would take a match
+past AI_MAX_QUEUE_PER_MATCH or the server past AI_MAX_QUEUE_DEPTH waiting
+requests is answered at once with a depth-1 move searched in-process, as is
+a request whose search fails (a crashed worker's pool is replaced). Every
+game keeps getting quick answers, just weaker ones under overload.
+"""
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Dict, Optional, Set
+from backend.ai_engine import AIEngine
+from backend.analysis import ANALYSIS_WORKERS
+from backend.models import GameState, Move
+from backend import metrics
+
+# AI_CPU_BUDGET: searches allowed to run at once (one process each; 0 searches on the server's threadpool, one at a time).
+#   Defaults to the cores left over from the analysis pool, so the two never compete for a core.
+# AI_SHED_QUEUE_DEPTH: waiting requests beyond which searches are degraded
+# AI_TIME_BUDGET_MS: time budget of a full-strength search
+AI_CPU_BUDGET = int(os.environ.get("AI_CPU_BUDGET", str(max(1, (os.cpu_count() or 1) - ANALYSIS_WORKERS))))
+AI_SHED_QUEUE_DEPTH = int(os.environ.get("AI_SHED_QUEUE_DEPTH", str(max(2, AI_CPU_BUDGET))))
+# AI_MAX_QUEUE_DEPTH: waiting requests beyond which new ones get an immediate in-process move
+# AI_MAX_QUEUE_PER_MATCH: the same cap for the requests of a single match
+AI_MAX_QUEUE_DEPTH = int(os.environ.get("AI_MAX_QUEUE_DEPTH", str(4 * AI_SHED_QUEUE_DEPTH)))
+AI_MAX_QUEUE_PER_MATCH = int(os.environ.get("AI_MAX_QUEUE_PER_MATCH", "1"))
+AI_TIME_BUDGET_MS = float(os.environ.get("AI_TIME_BUDGET_MS", "2000"))
+# AI_SEED: makes AI moves reproducible (e.g. for load tests): each search is
+# seeded from this and the position. Unset, the AI varies its play.
+AI_SEED = os.environ.get("AI_SEED")
+
+FULL_DEPTH = 2
+DEGRADED_DEPTH = 1
+DEGRADED_TIME_BUDGET_MS = 250
+
+def _warm_up():
+    """Submitted once per worker at startup so the first AI move doesn't pay for process start and imports."""
+
+def search_seed(state_data: Dict) -> Optional[str]:
+    """Seed for the search of this position, or None without AI_SEED."""
+    if AI_SEED is None:
+        return None
+    return f"{AI_SEED}:{state_data['zobristHash']}:{len(state_data['history'])}"
+
+def search_move(state_data: Dict, depth: int, time_budget_ms: float, seed: Optional[str] = None,
+                prove: bool = True) -> Dict:
+    """Worker entry point: plain data in and out so it can run in another process."""
+    engine = AIEngine(rng=random.Random(seed) if seed is not None else None)
+    move = engine.get_best_move(GameState(**state_data), depth=depth, time_budget_ms=time_budget_ms, prove=prove)
+    return {
+        "move": move,
+        "seconds": engine.last_search_seconds,
+        "nodes": engine.nodes,
+    }
+
+def quick_move(state_data: Dict) -> Optional[Move]:
+    """A depth-1 move without the pre-pass, cheap enough to search on the event loop."""
+    return search_move(state_data, DEGRADED_DEPTH, DEGRADED_TIME_BUDGET_MS, search_seed(state_data), prove=False)["move"]
+
+class AIRequest:
+    __slots__ = ("match_id", "state_data", "future", "enqueued_at")
+
+    def __init__(self, match_id: str, state_data: Dict, future: asyncio.Future):
+        self.match_id = match_id
+        self.state_data = state_data
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+class AIScheduler:
+    def __init__(self, cpu_budget: int = AI_CPU_BUDGET, shed_queue_depth: int = AI_SHED_QUEUE_DEPTH,
+                 time_budget_ms: float = AI_TIME_BUDGET_MS, max_queue_depth: int = AI_MAX_QUEUE_DEPTH,
+                 max_queue_per_match: int = AI_MAX_QUEUE_PER_MATCH):
+        self.use_processes = cpu_budget > 0
+        self.cpu_budget = max(1, cpu_budget)
+        self.shed_queue_depth = shed_queue_depth
+        self.time_budget_ms = time_budget_ms
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_per_match = max_queue_per_match
+        # Per-match FIFO of waiting requests, and the round-robin order of matches
+        self._queues: Dict[str, Deque[AIRequest]] = {}
+        self._ring: Deque[str] = deque()
+        self.waiting = 0
+        self.running = 0
+        self.degraded = 0
+        self.rejected = 0
+        self.failed = 0
+        self.last_queue_delay = 0.0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Running _run tasks; the event loop only keeps weak references
+        self._tasks: Set[asyncio.Task] = set()
+
+    def start(self):
+        """
+        Create the worker pool; call at server startup. Workers are spawned
+        rather than forked, so they don't inherit the server's sockets (a
+        forked worker holds client websockets open until it exits).
+        """
+        if not self.use_processes or self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(max_workers=self.cpu_budget, mp_context=multiprocessing.get_context("spawn"))
+        for _ in range(self.cpu_budget):
+            self._pool.submit(_warm_up)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if not self.use_processes:
+            return None
+        # Scripts that never ran start() still get a spawned pool
+        self.start()
+        return self._pool
+
+    async def request_move(self, match_id: str, state: GameState) -> Optional[Move]:
+        """
+        Queue an AI move for `state` and wait for the result. Past the queue
+        caps the move is searched at once, in-process.
+        """
+        state_data = state.model_dump() if hasattr(state, "model_dump") else state.dict()
+        queue = self._queues.get(match_id)
+        if self.waiting >= self.max_queue_depth or (queue is not None and len(queue) >= self.max_queue_per_match):
+            self.rejected += 1
+            if metrics.METRICS_ENABLED:
+                metrics.AI_REJECTED_REQUESTS.inc()
+            return quick_move(state_data)
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[match_id] = deque()
+            self._ring.append(match_id)
+        queue.append(AIRequest(match_id, state_data, future))
+        self.waiting += 1
+
+        self._dispatch()
+        return await future
+
+    def _dispatch(self):
+        while self.running < self.cpu_budget and self._ring:
+            match_id = self._ring.popleft()
+            queue = self._queues[match_id]
+            request = queue.popleft()
+            if queue:
+                self._ring.append(match_id)
+            else:
+                del self._queues[match_id]
+
+            self.waiting -= 1
+            self.running += 1
+            task = asyncio.ensure_future(self._run(request, overloaded=self.waiting >= self.shed_queue_depth))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, request: AIRequest, overloaded: bool):
+        self.last_queue_delay = time.perf_counter() - request.enqueued_at
+        if metrics.METRICS_ENABLED:
+            metrics.AI_QUEUE_DELAY_SECONDS.observe(self.last_queue_delay)
+
+        if overloaded:
+            self.degraded += 1
+            if metrics.METRICS_ENABLED:
+                metrics.AI_DEGRADED_SEARCHES.inc()
+            depth, time_budget_ms, prove = DEGRADED_DEPTH, DEGRADED_TIME_BUDGET_MS, False
+        else:
+            depth, time_budget_ms, prove = FULL_DEPTH, self.time_budget_ms, True
+
+        executor = None
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._executor()
+            result = await loop.run_in_executor(executor, search_move, request.state_data, depth, time_budget_ms,
+                                                search_seed(request.state_data), prove)
+            if self.use_processes:
+                # Searches in worker processes record into the worker's registry.
+                metrics.record_ai_search(result["seconds"], result["nodes"])
+            if not request.future.done():
+                request.future.set_result(result["move"])
+        except Exception as e:
+            # A crashed worker breaks the whole pool; drop it so the next search starts a fresh one
+            if isinstance(e, BrokenProcessPool) and executor is not None and executor is self._pool:
+                self._pool = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            print(f"AI search failed in {request.match_id}: {e!r}; playing a depth-1 move instead")
+            self.failed += 1
+            if not request.future.done():
+                try:
+                    request.future.set_result(quick_move(request.state_data))
+                except Exception as fallback_error:
+                    request.future.set_exception(fallback_error)
+        finally:
+            self.running -= 1
+            self._dispatch()
+
+ai_scheduler = AIScheduler()
@@ -0,0 +1,214 @@
+"""
+Position analysis for the coaching/review features.
+
+Positions are searched with AIEngine using iterative deepening under a time
+budget, and every root move is scored so callers can show the top-N
+alternatives (multi-PV). Completed depths are cached by Zobrist hash, so
+repeated analysis of popular positions is served from memory, and deeper
+requests resume from the deepest cached depth. Batches are spread across a
+small process pool of their own, kept out of the AI's CPU budget (see
+ai_scheduler), and the time budget covers the whole request, so a large
+batch can't hold the pool for longer than one budget.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from backend.ai_engine import AIEngine, SearchTimeout
+from backend.game_engine import GameEngine, compute_zobrist_hash
+from backend.models import GameState, Position
+
+# ANALYSIS_WORKERS: processes used for analysis, a quarter of the cores by default
+#   (0 runs searches on the server's threadpool)
+# ANALYSIS_CACHE_SIZE: number of (position, depth) results kept in memory
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", "4096"))
+
+MAX_ANALYSIS_DEPTH = 5
+MAX_TIME_BUDGET_MS = 10000
+MAX_BATCH_SIZE = 32
+
+# (from_node, to_node, score) for every legal root move
+ScoredMoves = List[Tuple[Optional[int], int, float]]
+
+def position_to_state(position: Position) -> GameState:
+    if len(position.board) != 23:
+        raise ValueError("Board must have 23 nodes")
+    if not 0 <= position.goatsInHand <= 15 or not 0 <= position.goatsKilled <= 5:
+        raise ValueError("goatsInHand must be 0-15 and goatsKilled 0-5")
+    if position.board.count("T") != 3:
+        raise ValueError("Board must have exactly 3 tigers")
+    if position.board.count("G") + position.goatsInHand + position.goatsKilled != 15:
+        raise ValueError("Goats on board, in hand and killed must add up to 15")
+
+    zobrist_hash = compute_zobrist_hash(position.board, position.activePlayer, position.goatsInHand, position.goatsKilled)
+    state = GameState(
+        matchId="analysis",
+        variant="3T-15G-23N",
+        turnIndex=0,
+        activePlayer=position.activePlayer,
+        phase="PLACEMENT" if position.goatsInHand > 0 else "MOVEMENT",
+        board=list(position.board),
+        goatsInHand=position.goatsInHand,
+        goatsKilled=position.goatsKilled,
+        history=[zobrist_hash],
+        zobristHash=zobrist_hash,
+    )
+
+    # Flag positions that are already decided (capture limit or trapped tigers).
+    GameEngine(state=state)._check_win_condition()
+    return state
+
+def search_position(state_data: Dict, max_depth: int, deadline: float, start_depth: int) -> Dict:
+    """
+    Iteratively deepen from start_depth to max_depth until `deadline` (a
+    time.time() value, so it means the same in every process). Runs in a
+    worker process, so it takes and returns plain data.
+    """
+    state = GameState(**state_data)
+    engine = AIEngine()
+    deadline = time.perf_counter() + (deadline - time.time())
+    depths: Dict[int, ScoredMoves] = {}
+
+    for depth in range(start_depth, max_depth + 1):
+        # Depth 1 is cheap and always finished, so there is something to return.
+        engine.deadline = None if depth == 1 else deadline
+        try:
+            scored = engine.score_moves(state, depth)
+        except SearchTimeout:
+            break
+        depths[depth] = [(move.from_node, move.to_node, score) for move, score in scored]
+        if time.perf_counter() > deadline:
+            break
+
+    return {"depths": depths, "nodes": engine.nodes}
+
+class AnalysisCache:
+    """LRU of scored root moves keyed by (zobristHash, depth)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], ScoredMoves]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, zobrist_hash: str, depth: int) -> Optional[ScoredMoves]:
+        key = (zobrist_hash, depth)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def deepest(self, zobrist_hash: str, max_depth: int) -> Tuple[int, Optional[ScoredMoves]]:
+        for depth in range(max_depth, 0, -1):
+            entry = self.get(zobrist_hash, depth)
+            if entry is not None:
+                return depth, entry
+        return 0, None
+
+    def set(self, zobrist_hash: str, depth: int, scored: ScoredMoves):
+        if self.max_entries <= 0:
+            return
+        self._entries[(zobrist_hash, depth)] = scored
+        self._entries.move_to_end((zobrist_hash, depth))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+analysis_cache = AnalysisCache(ANALYSIS_CACHE_SIZE)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def start_pool():
+    """
+    Create the analysis pool; call at server startup. Workers are spawned
+    rather than forked so they don't inherit the server's sockets. They
+    start on the first request, so servers that never analyze pay nothing.
+    """
+    global _pool
+    if ANALYSIS_WORKERS > 0 and _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    if ANALYSIS_WORKERS <= 0:
+        return None
+    start_pool()
+    return _pool
+
+def _format_result(state: GameState, depth: int, scored: ScoredMoves, multi_pv: int, nodes: int, elapsed: float, cached: bool) -> Dict:
+    ranked = sorted(scored, key=lambda m: m[2], reverse=True)[:multi_pv]
+    return {
+        "zobristHash": state.zobristHash,
+        "sideToMove": state.activePlayer,
+        "phase": state.phase,
+        "winner": state.winner,
+        "depth": depth,
+        "nodes": nodes,
+        "timeMs": round(elapsed * 1000, 2),
+        "cached": cached,
+        "moves": [{"from_node": f, "to_node": t, "score": score} for f, t, score in ranked],
+    }
+
+async def analyze_positions(positions: List[Position], multi_pv: int, depth: int, time_budget_ms: int) -> List[Dict]:
+    """
+    Analyze positions concurrently, all within one `time_budget_ms`.
+    Raises ValueError for invalid input.
+    """
+    if len(positions) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} positions per request")
+    multi_pv = max(1, multi_pv)
+    depth = max(1, min(depth, MAX_ANALYSIS_DEPTH))
+    time_budget_ms = max(1, min(time_budget_ms, MAX_TIME_BUDGET_MS))
+
+    states = [position_to_state(p) for p in positions]
+    start = time.perf_counter()
+    deadline = time.time() + time_budget_ms / 1000
+    results: List[Optional[Dict]] = [None] * len(states)
+    pending = []
+
+    for i, state in enumerate(states):
+        if state.phase == "GAME_OVER":
+            results[i] = _format_result(state, 0, [], multi_pv, 0, 0.0, False)
+            continue
+
+        cached_depth, cached = analysis_cache.deepest(state.zobristHash, depth)
+        if cached_depth == depth:
+            analysis_cache.hits += 1
+            results[i] = _format_result(state, depth, cached, multi_pv, 0, time.perf_counter() - start, True)
+            continue
+
+        analysis_cache.misses += 1
+        pending.append((i, state, cached_depth, cached))
+
+    if pending:
+        loop = asyncio.get_running_loop()
+        pool = _get_pool()
+        searches = [
+            loop.run_in_executor(
+                pool, search_position,
+                state.model_dump() if hasattr(state, "model_dump") else state.dict(),
+                depth, deadline, cached_depth + 1,
+            )
+            for _, state, cached_depth, _ in pending
+        ]
+        outcomes = await asyncio.gather(*searches)
+
+        for (i, state, cached_depth, cached), outcome in zip(pending, outcomes):
+            best_depth, best = cached_depth, cached
+            for searched_depth, scored in outcome["depths"].items():
+                analysis_cache.set(state.zobristHash, searched_depth, scored)
+                if searched_depth > best_depth:
+                    best_depth, best = searched_depth, scored
+            results[i] = _format_result(state, best_depth, best or [], multi_pv, outcome["nodes"],
+                                        time.perf_counter() - start, False)
+
+    return results
@@ -0,0 +1,371 @@
+"""
+Vectorized GameEngine rules for batches of positions.
+
+Offline tooling (self-play, tablebase generation, playouts) works on many
+positions at once. A PositionBatch keeps N positions as NumPy arrays: two
+uint32 occupancy bitboards (bit n is set when a tiger / goat stands on node
+n) plus per-position counters. Step targets and jumps are precomputed as
+bitmasks per node, so mobility, captures, terminal status, evaluation and
+features cost a few bitwise operations per tiger and position, and moves
+are applied by flipping bits.
+
+Moves are indexed by the single-byte codes of game_record.MOVE_TABLE, so a
+legal-move mask is an N x len(MOVE_TABLE) boolean array. Building it is the
+one step that still touches every move code of every position.
+
+Results match GameEngine / AIEngine exactly, except that repetition draws
+are not detected: a batch does not carry position history.
+
+Run from the repository root to check against the scalar engine and time it:
+    python -m backend.batch_engine [positions]
+"""
+import random
+import sys
+import time
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from backend.game_engine import ADJACENCY_MAP, GameEngine, JUMP_TABLE
+from backend.game_record import MOVE_TABLE, MOVE_CODES, play_random_game
+from backend.models import GameState, Move
+
+# Piece / side codes
+EMPTY, TIGER, GOAT = 0, 1, 2
+PIECE_CODES = {"E": EMPTY, "T": TIGER, "G": GOAT}
+PIECE_NAMES = {EMPTY: "E", TIGER: "T", GOAT: "G"}
+SIDE_CODES = {"TIGER": TIGER, "GOAT": GOAT}
+SIDE_NAMES = {TIGER: "TIGER", GOAT: "GOAT"}
+WINNER_CODES = {None: 0, "TIGER": TIGER, "GOAT": GOAT}
+
+# Phase codes
+PLACEMENT, MOVEMENT, GAME_OVER = 0, 1, 2
+PHASE_CODES = {"PLACEMENT": PLACEMENT, "MOVEMENT": MOVEMENT, "GAME_OVER": GAME_OVER}
+PHASE_NAMES = {v: k for k, v in PHASE_CODES.items()}
+
+NUM_NODES = 23
+NUM_MOVES = len(MOVE_TABLE)
+# Tigers are never captured, so every position has all three
+NUM_TIGERS = 3
+
+NODE_BITS = np.left_shift(np.uint32(1), np.arange(NUM_NODES, dtype=np.uint32))
+ALL_NODES = np.uint32((1 << NUM_NODES) - 1)
+
+def _build_node_masks():
+    steps = np.zeros(NUM_NODES, dtype=np.uint32)
+    for node, neighbours in ADJACENCY_MAP.items():
+        for neighbour in neighbours:
+            steps[node] |= 1 << neighbour
+
+    jumps = [[] for _ in range(NUM_NODES)]
+    for start, over, land in JUMP_TABLE:
+        jumps[start].append((over, land))
+    width = max(len(node_jumps) for node_jumps in jumps)
+    jump_over = np.zeros((NUM_NODES, width), dtype=np.uint32)
+    jump_land = np.zeros((NUM_NODES, width), dtype=np.uint32)
+    for node, node_jumps in enumerate(jumps):
+        for k, (over, land) in enumerate(node_jumps):
+            jump_over[node, k] = 1 << over
+            jump_land[node, k] = 1 << land
+    return steps, jump_over, jump_land
+
+# Per node: bitmask of step targets, and the jumped-over / landing bit of each jump (0 as padding)
+STEP_TARGETS, JUMP_OVER, JUMP_LAND = _build_node_masks()
+
+def _build_move_arrays():
+    over_by_jump = {(start, land): over for start, over, land in JUMP_TABLE}
+    from_idx = np.zeros(NUM_MOVES, dtype=np.intp)
+    to_idx = np.zeros(NUM_MOVES, dtype=np.intp)
+    over_idx = np.zeros(NUM_MOVES, dtype=np.intp)
+    is_placement = np.zeros(NUM_MOVES, dtype=bool)
+    is_step = np.zeros(NUM_MOVES, dtype=bool)
+    is_jump = np.zeros(NUM_MOVES, dtype=bool)
+
+    for code, (from_node, to_node) in enumerate(MOVE_TABLE):
+        to_idx[code] = to_node
+        if from_node is None:
+            is_placement[code] = True
+            continue
+        from_idx[code] = from_node
+        if (from_node, to_node) in over_by_jump:
+            is_jump[code] = True
+            over_idx[code] = over_by_jump[(from_node, to_node)]
+        else:
+            is_step[code] = True
+
+    return from_idx, to_idx, over_idx, is_placement, is_step, is_jump
+
+# Per move code: source, target and jumped-over node (0 where not applicable)
+MOVE_FROM, MOVE_TO, MOVE_OVER, IS_PLACEMENT, IS_STEP, IS_JUMP = _build_move_arrays()
+# The same as bitmasks, 0 where not applicable, for applying moves
+MOVE_FROM_BIT = np.where(IS_PLACEMENT, 0, NODE_BITS[MOVE_FROM]).astype(np.uint32)
+MOVE_TO_BIT = NODE_BITS[MOVE_TO]
+MOVE_OVER_BIT = np.where(IS_JUMP, NODE_BITS[MOVE_OVER], 0).astype(np.uint32)
+
+# legal_move_mask packs each position into one uint64: the mover's pieces in
+# bits 0-22, empty nodes in bits 23-45 and goats on the nodes a jump can go
+# over from bit 46 up. A move is legal when all of its required bits are set
+# and it is the kind of move the side to move makes.
+JUMPABLE_NODES = sorted({over for _, over, _ in JUMP_TABLE})
+_EMPTY_SHIFT, _JUMPED_SHIFT = NUM_NODES, 2 * NUM_NODES
+
+def _build_move_requirements():
+    required = MOVE_FROM_BIT.astype(np.uint64) | (MOVE_TO_BIT.astype(np.uint64) << _EMPTY_SHIFT)
+    for code in np.nonzero(IS_JUMP)[0]:
+        required[code] |= np.uint64(1 << (_JUMPED_SHIFT + JUMPABLE_NODES.index(MOVE_OVER[code])))
+    # Rows: goat placing, goat moving, tiger
+    kinds = np.stack([IS_PLACEMENT, IS_STEP, IS_STEP | IS_JUMP])
+    return required, kinds
+
+MOVE_REQUIRED, MOVE_KINDS = _build_move_requirements()
+
+def node_mask(bits: np.ndarray) -> np.ndarray:
+    """N x NUM_NODES boolean occupancy of N bitboards."""
+    return (bits[:, None] & NODE_BITS) != 0
+
+class PositionBatch:
+    """N positions as parallel arrays. Rows are independent positions."""
+
+    FIELDS = ("tigers", "goats", "side", "phase", "goats_in_hand", "goats_killed", "winner")
+
+    def __init__(self, tigers: np.ndarray, goats: np.ndarray, side: np.ndarray, phase: np.ndarray,
+                 goats_in_hand: np.ndarray, goats_killed: np.ndarray, winner: Optional[np.ndarray] = None):
+        self.tigers = tigers
+        self.goats = goats
+        self.side = side
+        self.phase = phase
+        self.goats_in_hand = goats_in_hand
+        self.goats_killed = goats_killed
+        self.winner = winner if winner is not None else np.zeros(len(tigers), dtype=np.int8)
+
+    def __len__(self) -> int:
+        return len(self.tigers)
+
+    @classmethod
+    def from_states(cls, states: Sequence[GameState]) -> "PositionBatch":
+        # One byte per node ("E", "T" or "G"), packed into bitboards in one pass
+        boards = np.frombuffer("".join("".join(s.board) for s in states).encode(), dtype=np.uint8)
+        boards = boards.reshape(len(states), NUM_NODES)
+        return cls(
+            tigers=np.bitwise_or.reduce(np.where(boards == ord("T"), NODE_BITS, 0), axis=1).astype(np.uint32),
+            goats=np.bitwise_or.reduce(np.where(boards == ord("G"), NODE_BITS, 0), axis=1).astype(np.uint32),
+            side=np.array([SIDE_CODES[s.activePlayer] for s in states], dtype=np.int8),
+            phase=np.array([PHASE_CODES[s.phase] for s in states], dtype=np.int8),
+            goats_in_hand=np.array([s.goatsInHand for s in states], dtype=np.int8),
+            goats_killed=np.array([s.goatsKilled for s in states], dtype=np.int8),
+            winner=np.array([WINNER_CODES[s.winner] for s in states], dtype=np.int8),
+        )
+
+    @classmethod
+    def concatenate(cls, batches: Sequence["PositionBatch"]) -> "PositionBatch":
+        return cls(*(np.concatenate([getattr(b, name) for b in batches]) for name in cls.FIELDS))
+
+    @property
+    def boards(self) -> np.ndarray:
+        """N x NUM_NODES board of piece codes."""
+        return np.where(node_mask(self.tigers), TIGER, np.where(node_mask(self.goats), GOAT, EMPTY)).astype(np.int8)
+
+    @property
+    def empty(self) -> np.ndarray:
+        return ALL_NODES & ~(self.tigers | self.goats)
+
+    def take(self, rows: np.ndarray) -> "PositionBatch":
+        """The positions at `rows` (an index array or boolean mask), as a new batch."""
+        return PositionBatch(*(getattr(self, name)[rows] for name in self.FIELDS))
+
+    def copy(self) -> "PositionBatch":
+        return PositionBatch(*(getattr(self, name).copy() for name in self.FIELDS))
+
+def tiger_nodes(tigers: np.ndarray) -> np.ndarray:
+    """N x NUM_TIGERS nodes the tigers stand on, in node order."""
+    nodes = np.empty((len(tigers), NUM_TIGERS), dtype=np.intp)
+    rest = tigers.copy()
+    for i in range(NUM_TIGERS):
+        lowest = rest & (~rest + 1)
+        nodes[:, i] = np.bitwise_count(lowest - 1)
+        rest ^= lowest
+    return nodes
+
+def tiger_moves(batch: PositionBatch) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bitmasks of the tigers' options. Returns N x NUM_TIGERS step targets and
+    capture landing nodes per tiger (in node order), and per position the
+    goats that at least one capture jumps over.
+    """
+    empty = batch.empty[:, None]
+    goats = batch.goats[:, None]
+    nodes = tiger_nodes(batch.tigers)
+    steps = STEP_TARGETS[nodes] & empty
+    captures = np.zeros_like(steps)
+    threatened = np.zeros_like(steps)
+    for k in range(JUMP_OVER.shape[1]):
+        over, land = JUMP_OVER[nodes, k], JUMP_LAND[nodes, k]
+        legal = ((over & goats) != 0) & ((land & empty) != 0)
+        captures |= np.where(legal, land, 0).astype(np.uint32)
+        threatened |= np.where(legal, over, 0).astype(np.uint32)
+    return steps, captures, np.bitwise_or.reduce(threatened, axis=1)
+
+def legal_move_mask(batch: PositionBatch, player: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    N x NUM_MOVES mask of the moves GameEngine.get_valid_moves(player) would
+    return for each position. `player` defaults to the side to move.
+    """
+    if player is None:
+        player = batch.side
+    tiger = player == TIGER
+    packed = np.where(tiger, batch.tigers, batch.goats).astype(np.uint64)
+    packed |= batch.empty.astype(np.uint64) << np.uint64(_EMPTY_SHIFT)
+    for i, node in enumerate(JUMPABLE_NODES):
+        packed |= ((batch.goats >> node) & 1).astype(np.uint64) << np.uint64(_JUMPED_SHIFT + i)
+
+    kind = np.where((batch.phase == PLACEMENT) & (player == GOAT), 0, np.where(tiger, 2, 1))
+    return ((packed[:, None] & MOVE_REQUIRED) == MOVE_REQUIRED) & MOVE_KINDS[kind]
+
+def tiger_mobility(batch: PositionBatch) -> np.ndarray:
+    """Number of tiger moves per position (len(get_valid_moves("TIGER")))."""
+    steps, captures, _ = tiger_moves(batch)
+    return (np.bitwise_count(steps) + np.bitwise_count(captures)).sum(axis=1)
+
+def terminal_status(batch: PositionBatch):
+    """
+    Apply GameEngine._check_win_condition to every position.
+    Returns (is_terminal, winner) arrays; winner uses TIGER / GOAT / 0.
+    """
+    tiger_wins = batch.goats_killed >= 5
+    goat_wins = ~tiger_wins & (tiger_mobility(batch) == 0)
+    winner = np.where(tiger_wins, TIGER, np.where(goat_wins, GOAT, 0)).astype(np.int8)
+    return tiger_wins | goat_wins, winner
+
+def evaluate(batch: PositionBatch, ai_player: int) -> np.ndarray:
+    """Vectorized AIEngine.evaluate_state for every position, from ai_player's view."""
+    sign = 1 if ai_player == TIGER else -1
+    score = sign * (batch.goats_killed.astype(np.int64) * 100 + tiger_mobility(batch).astype(np.int64) * 10)
+    decided = batch.winner != 0
+    return np.where(decided, np.where(batch.winner == ai_player, 10000, -10000), score)
+
+FEATURE_NAMES = [
+    "goats_killed", "goats_in_hand", "goats_on_board", "tiger_mobility",
+    "captures_available", "threatened_goats", "side_to_move_tiger", "placement_phase",
+    "trapped_tigers", "least_mobile_tiger",
+]
+
+def features(batch: PositionBatch) -> np.ndarray:
+    """N x len(FEATURE_NAMES) float32 evaluation features."""
+    steps, captures, threatened = tiger_moves(batch)
+    # Moves available to each tiger; the goats win by driving these to zero.
+    per_tiger = np.bitwise_count(steps) + np.bitwise_count(captures)
+
+    return np.stack([
+        batch.goats_killed,
+        batch.goats_in_hand,
+        np.bitwise_count(batch.goats),
+        per_tiger.sum(axis=1),
+        np.bitwise_count(captures).sum(axis=1),
+        np.bitwise_count(threatened),
+        batch.side == TIGER,
+        batch.phase == PLACEMENT,
+        (per_tiger == 0).sum(axis=1),
+        per_tiger.min(axis=1),
+    ], axis=1).astype(np.float32)
+
+def apply_moves(batch: PositionBatch, codes: np.ndarray) -> PositionBatch:
+    """
+    Play one move code per position (as GameEngine.apply_move would, minus
+    the Zobrist hash and repetition check) and return the resulting batch.
+    Codes must be legal; use legal_move_mask to pick them.
+    """
+    result = batch.copy()
+    from_bits, to_bits, over_bits = MOVE_FROM_BIT[codes], MOVE_TO_BIT[codes], MOVE_OVER_BIT[codes]
+    # Legal codes move the side to move's own pieces; placements have no source bit
+    tiger = batch.side == TIGER
+    result.tigers = np.where(tiger, (batch.tigers & ~from_bits) | to_bits, batch.tigers)
+    result.goats = np.where(tiger, batch.goats & ~over_bits, (batch.goats & ~from_bits) | to_bits)
+    result.goats_in_hand = result.goats_in_hand - IS_PLACEMENT[codes]
+    result.goats_killed = result.goats_killed + IS_JUMP[codes]
+
+    is_terminal, winner = terminal_status(result)
+    result.winner = np.where(is_terminal, winner, result.winner).astype(np.int8)
+    # _toggle_turn: placement ends once the last goat is in, then the side flips.
+    result.phase = np.where(
+        is_terminal, GAME_OVER,
+        np.where((result.phase == PLACEMENT) & (result.goats_in_hand == 0), MOVEMENT, result.phase),
+    ).astype(np.int8)
+    result.side = np.where(result.side == TIGER, GOAT, TIGER).astype(np.int8)
+    return result
+
+def _sample_states(count: int, rng: random.Random) -> List[GameState]:
+    states = []
+    while len(states) < count:
+        engine = GameEngine()
+        plies = rng.randrange(0, 80)
+        for _ in range(plies):
+            if engine.state.phase == "GAME_OVER":
+                break
+            moves = engine.get_valid_moves(engine.state.activePlayer)
+            if not moves:
+                break
+            engine.apply_move(rng.choice(moves))
+        states.append(engine.state)
+    return states
+
+def _check_against_scalar(states: List[GameState], rng: random.Random):
+    from backend.ai_engine import AIEngine
+
+    batch = PositionBatch.from_states(states)
+    ai = AIEngine()
+    for player in ("TIGER", "GOAT"):
+        player_codes = np.full(len(states), SIDE_CODES[player], dtype=np.int8)
+        mask = legal_move_mask(batch, player_codes)
+        scores = evaluate(batch, SIDE_CODES[player])
+        for i, state in enumerate(states):
+            expected = sorted(MOVE_CODES[(m.from_node, m.to_node)] for m in GameEngine(state=state).get_valid_moves(player))
+            assert expected == list(np.nonzero(mask[i])[0]), f"move mismatch for {player} at position {i}"
+            assert scores[i] == ai.evaluate_state(state, player), f"evaluation mismatch at position {i}"
+
+    is_terminal, winner = terminal_status(batch)
+    mask = legal_move_mask(batch)
+    live = [i for i, s in enumerate(states) if s.phase != "GAME_OVER" and mask[i].any()]
+    codes = np.array([rng.choice(list(np.nonzero(mask[i])[0])) for i in live], dtype=np.intp)
+    sub = PositionBatch.from_states([states[i] for i in live])
+    after = apply_moves(sub, codes)
+    for row, (i, code) in enumerate(zip(live, codes)):
+        engine = GameEngine(state=states[i].model_copy(deep=True))
+        from_node, to_node = MOVE_TABLE[code]
+        engine.apply_move(Move(player=engine.state.activePlayer, from_node=from_node, to_node=to_node, playerId="CHECK"))
+        s = engine.state
+        if s.winReason == "REPETITION":
+            continue
+        assert [PIECE_NAMES[p] for p in after.boards[row]] == s.board, f"board mismatch after move at {i}"
+        assert SIDE_NAMES[int(after.side[row])] == s.activePlayer
+        assert PHASE_NAMES[int(after.phase[row])] == s.phase
+        assert int(after.goats_in_hand[row]) == s.goatsInHand and int(after.goats_killed[row]) == s.goatsKilled
+        assert WINNER_CODES[s.winner] == int(after.winner[row])
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(0)
+    states = _sample_states(count, rng)
+
+    _check_against_scalar(states, rng)
+    print(f"Batch engine matches GameEngine on {count} positions")
+
+    from backend.ai_engine import AIEngine
+    ai = AIEngine()
+
+    start = time.perf_counter()
+    for state in states:
+        engine = GameEngine(state=state)
+        engine.get_valid_moves(state.activePlayer)
+        ai.evaluate_state(state, "TIGER")
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = PositionBatch.from_states(states)
+    encoded = time.perf_counter() - start
+    legal_move_mask(batch)
+    terminal_status(batch)
+    evaluate(batch, TIGER)
+    features(batch)
+    vectorized = time.perf_counter() - start - encoded
+
+    print(f"Scalar  (moves + eval):                {scalar * 1e6 / count:8.2f} us/position")
+    print(f"Batched (moves + terminal + eval + features): {vectorized * 1e6 / count:8.2f} us/position "
+          f"(+{encoded * 1e6 / count:.2f} us/position to encode from GameState)")
@@ -0,0 +1,67 @@
+"""
+GameEngine move benchmark.
+
+Measures apply_move and undo_move per ply as the game history grows. With
+the journaled apply_move both should stay flat; only the first move on an
+engine pays once to count the existing history for the repetition check.
+
+Run from the repository root:
+    python -m backend.bench_engine [repeats]
+"""
+import random
+import sys
+import time
+from typing import List, Tuple
+from backend.game_engine import GameEngine
+from backend.models import Move
+
+HISTORY_LENGTHS = (0, 1000, 10000, 100000)
+LINE_LENGTH = 40
+
+def sample_line(seed: int = 0) -> List[Move]:
+    """A random line of play from the start position."""
+    rng = random.Random(seed)
+    engine = GameEngine()
+    while len(engine.moves) < LINE_LENGTH and engine.state.phase != "GAME_OVER":
+        engine.apply_move(rng.choice(engine.get_valid_moves(engine.state.activePlayer)))
+    return engine.moves
+
+def bench_line(history_length: int, line: List[Move], repeats: int) -> Tuple[float, float, float]:
+    """
+    Microseconds for the first apply_move on a fresh engine, then per
+    apply_move and per undo_move for `line`, after `history_length` earlier
+    plies.
+    """
+    engine = GameEngine()
+    # Stand-ins for earlier positions; above 64 bits, so they never repeat a real hash
+    engine.state.history[:0] = [hex((1 << 64) + i) for i in range(history_length)]
+
+    start = time.perf_counter()
+    engine.apply_move(line[0])
+    first = time.perf_counter() - start
+    engine.undo_move()
+
+    applied = undone = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for move in line:
+            engine.apply_move(move)
+        applied += time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in line:
+            engine.undo_move()
+        undone += time.perf_counter() - start
+    plies = len(line) * repeats
+    return first * 1e6, applied * 1e6 / plies, undone * 1e6 / plies
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    line = sample_line()
+    print(f"{len(line)}-ply line, {repeats} repeats")
+    for history_length in HISTORY_LENGTHS:
+        first, applied, undone = bench_line(history_length, line, repeats)
+        print(f"history {history_length:>6}: apply_move {applied:6.2f} us  undo_move {undone:6.2f} us  "
+              f"(first move on the engine: {first:8.1f} us)")
+
+if __name__ == "__main__":
+    main()
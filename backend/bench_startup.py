@@ -0,0 +1,57 @@
+"""
+Startup-time benchmark.
+
+Measures how long a fresh interpreter takes to import backend.main (what a
+new uvicorn worker pays before it can accept connections), and how long the
+first stats lookup takes once the stats backend is actually touched.
+
+Run from the repository root:
+    python -m backend.bench_startup [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import backend.main
+t1 = time.perf_counter()
+from backend.database import get_player_stats
+get_player_stats("bench_startup_player")
+t2 = time.perf_counter()
+print(f"{t1 - t0} {t2 - t1}")
+"""
+
+def run_once(env: dict):
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # The last line holds the timings; anything before it is server logging.
+    import_time, first_call = result.stdout.strip().splitlines()[-1].split()
+    return float(import_time), float(first_call)
+
+def bench(label: str, runs: int, extra_env: dict):
+    env = dict(os.environ)
+    env.update(extra_env)
+    env["PYTHONPATH"] = os.getcwd() + os.pathsep + env.get("PYTHONPATH", "")
+
+    samples = [run_once(env) for _ in range(runs)]
+    import_times = [s[0] * 1000 for s in samples]
+    first_calls = [s[1] * 1000 for s in samples]
+
+    print(f"{label}:")
+    print(f"  import backend.main  median {statistics.median(import_times):8.1f} ms  (min {min(import_times):.1f} ms)")
+    print(f"  first stats lookup   median {statistics.median(first_calls):8.1f} ms  (min {min(first_calls):.1f} ms)")
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"Startup benchmark ({runs} runs each)\n")
+    bench("STATS_BACKEND=firestore", runs, {"STATS_BACKEND": "firestore"})
+    bench("STATS_BACKEND=memory", runs, {"STATS_BACKEND": "memory"})
+    bench("STATS_BACKEND=none", runs, {"STATS_BACKEND": "none"})
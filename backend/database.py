@@ -1,20 +1,310 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
 import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from backend import metrics
 
-# Initialize Firebase Admin
+# Firebase Admin is imported and initialized lazily, on the first stats read or
+# write, so importing this module (and backend.main) stays cheap.
 # Expecting 'firebase_serviceAccountKey.json' in the same directory or provided via env var
 cred_path = os.path.join(os.path.dirname(__file__), "firebase_serviceAccountKey.json")
 
-if os.path.exists(cred_path):
-    cred = credentials.Certificate(cred_path)
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    print("Firebase Admin initialized successfully.")
-else:
-    print(f"Warning: {cred_path} not found. Stats will not be saved.")
-    db = None
+# STATS_BACKEND: "firestore" (default), "memory" (process-local, for dev/tests) or "none"
+STATS_BACKEND = os.environ.get("STATS_BACKEND", "firestore")
+
+class StatsBackend(ABC):
+    """
+    Storage for player stats documents.
+
+    get() returns the stats dict ({} for unknown players) or None when the
+    backend is unavailable. increment() adds the given amounts to the
+    player's counters, creating the document if needed.
+    """
+
+    @abstractmethod
+    def get(self, player_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def increment(self, player_id: str, increments: Dict[str, int]):
+        ...
+
+class NullStatsBackend(StatsBackend):
+    """Discards writes and has no stats to read."""
+
+    def get(self, player_id: str) -> Optional[Dict]:
+        return None
+
+    def increment(self, player_id: str, increments: Dict[str, int]):
+        pass
+
+class InMemoryStatsBackend(StatsBackend):
+    """Keeps stats in process memory. Lost on restart."""
+
+    def __init__(self):
+        self._docs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, player_id: str) -> Optional[Dict]:
+        with self._lock:
+            return dict(self._docs.get(player_id, {}))
+
+    def increment(self, player_id: str, increments: Dict[str, int]):
+        with self._lock:
+            doc = self._docs.setdefault(player_id, {})
+            for field, amount in increments.items():
+                doc[field] = doc.get(field, 0) + amount
+
+class FirestoreStatsBackend(StatsBackend):
+    """Stores stats in the Firestore 'users' collection."""
+
+    def __init__(self, cred_path: str):
+        self.cred_path = cred_path
+        self._client = None
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._initialized:
+            return self._client
+
+        with self._lock:
+            if not self._initialized:
+                if os.path.exists(self.cred_path):
+                    import firebase_admin
+                    from firebase_admin import credentials
+                    from firebase_admin import firestore
+
+                    try:
+                        firebase_admin.get_app()
+                    except ValueError:
+                        firebase_admin.initialize_app(credentials.Certificate(self.cred_path))
+                    self._client = firestore.client()
+                    print("Firebase Admin initialized successfully.")
+                else:
+                    print(f"Warning: {self.cred_path} not found. Stats will not be saved.")
+                self._initialized = True
+
+        return self._client
+
+    def get(self, player_id: str) -> Optional[Dict]:
+        db = self._get_client()
+        if not db:
+            return None
+
+        with metrics.timer(metrics.FIRESTORE_CALL_SECONDS.labels("get")):
+            doc = db.collection("users").document(player_id).get()
+        if doc.exists:
+            return doc.to_dict()
+        return {}
+
+    def increment(self, player_id: str, increments: Dict[str, int]):
+        db = self._get_client()
+        if not db:
+            return
+
+        from firebase_admin import firestore
+
+        # Since we might be creating the doc, set with merge is good,
+        # and Increment keeps concurrent updates atomic.
+        updates = {field: firestore.Increment(amount) for field, amount in increments.items()}
+        with metrics.timer(metrics.FIRESTORE_CALL_SECONDS.labels("increment")):
+            db.collection("users").document(player_id).set(updates, merge=True)
+
+def _create_stats_backend(name: str) -> StatsBackend:
+    if name == "memory":
+        return InMemoryStatsBackend()
+    if name == "none":
+        return NullStatsBackend()
+    if name != "firestore":
+        print(f"Warning: unknown STATS_BACKEND '{name}', falling back to firestore.")
+    return FirestoreStatsBackend(cred_path)
+
+_stats_backend: Optional[StatsBackend] = None
+
+def get_stats_backend() -> StatsBackend:
+    global _stats_backend
+    if _stats_backend is None:
+        _stats_backend = _create_stats_backend(STATS_BACKEND)
+    return _stats_backend
+
+def set_stats_backend(backend: StatsBackend):
+    """Swap the stats backend (e.g. for tests or load runs). Clears the stats cache."""
+    global _stats_backend
+    _stats_backend = backend
+    stats_cache.clear()
+
+# Stats Cache Configuration
+# STATS_CACHE_TTL: seconds a cached stats document stays fresh (0 disables the cache)
+# STATS_CACHE_MAX_ENTRIES: bound on the number of players kept in process memory
+# STATS_CACHE_REDIS_URL: optional shared tier so all workers see the same entries
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", "30"))
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get("STATS_CACHE_MAX_ENTRIES", "10000"))
+STATS_CACHE_REDIS_URL = os.environ.get("STATS_CACHE_REDIS_URL")
+
+class StatsCache:
+    """
+    Read-through cache for player stats documents.
+
+    Entries live in a bounded LRU in process memory and expire after `ttl`
+    seconds. When a Redis URL is configured, misses fall back to the shared
+    tier before going to Firestore, so a freshly started worker doesn't have
+    to re-read every document.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, redis_url: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # player_id -> (expires_at, stats)
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        # player_id -> count of stats writes, so a read that raced a write isn't cached
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        # Sync endpoints run in FastAPI's threadpool, so guard the LRU.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self._shared = None
+
+        if redis_url:
+            try:
+                import redis
+                self._shared = redis.Redis.from_url(redis_url)
+            except ImportError:
+                print("Warning: redis package not installed. Shared stats cache disabled.")
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def _shared_key(self, player_id: str) -> str:
+        return f"stats:{player_id}"
+
+    def get(self, player_id: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(player_id)
+            if entry is not None:
+                expires_at, stats = entry
+                if expires_at > now:
+                    self._entries.move_to_end(player_id)
+                    self.hits += 1
+                    return dict(stats)
+                del self._entries[player_id]
+
+        if self._shared is not None:
+            try:
+                raw = self._shared.get(self._shared_key(player_id))
+            except Exception as e:
+                print(f"Error reading shared stats cache for {player_id}: {e}")
+                raw = None
+            if raw is not None:
+                stats = json.loads(raw)
+                self._store_local(player_id, stats)
+                with self._lock:
+                    self.shared_hits += 1
+                return dict(stats)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def generation(self, player_id: str) -> int:
+        """Take before reading the backend and pass to set()."""
+        with self._lock:
+            return self._generations.get(player_id, 0)
+
+    def _bump_generation(self, player_id: str):
+        with self._lock:
+            self._generations[player_id] = self._generations.get(player_id, 0) + 1
+            self._generations.move_to_end(player_id)
+            # A forgotten player reads as generation 0, which only makes in-flight reads skip caching
+            while len(self._generations) > self.max_entries:
+                self._generations.popitem(last=False)
+
+    def set(self, player_id: str, stats: Dict, generation: Optional[int] = None):
+        """
+        Cache `stats`. With `generation`, the document is dropped if the
+        player's stats were written since, as the read may predate the write.
+        """
+        if not self.enabled:
+            return
+
+        if not self._store_local(player_id, stats, generation):
+            return
+        if self._shared is not None:
+            try:
+                self._shared.set(self._shared_key(player_id), json.dumps(stats), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                print(f"Error writing shared stats cache for {player_id}: {e}")
+
+    def _store_local(self, player_id: str, stats: Dict, generation: Optional[int] = None) -> bool:
+        with self._lock:
+            if generation is not None and self._generations.get(player_id, 0) != generation:
+                return False
+            self._entries[player_id] = (time.monotonic() + self.ttl, dict(stats))
+            self._entries.move_to_end(player_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def apply_increments(self, player_id: str, increments: Dict[str, int]):
+        """
+        Mirror a Firestore increment on the cached copy so the next read
+        doesn't have to go back to Firestore. The shared tier is invalidated
+        instead, since other workers may hold their own copies.
+        """
+        self._bump_generation(player_id)
+        with self._lock:
+            entry = self._entries.get(player_id)
+            if entry is not None:
+                expires_at, stats = entry
+                for field, amount in increments.items():
+                    stats[field] = stats.get(field, 0) + amount
+
+        if self._shared is not None:
+            try:
+                self._shared.delete(self._shared_key(player_id))
+            except Exception as e:
+                print(f"Error invalidating shared stats cache for {player_id}: {e}")
+
+    def invalidate(self, player_id: str):
+        self._bump_generation(player_id)
+        with self._lock:
+            self._entries.pop(player_id, None)
+
+        if self._shared is not None:
+            try:
+                self._shared.delete(self._shared_key(player_id))
+            except Exception as e:
+                print(f"Error invalidating shared stats cache for {player_id}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self.hits = 0
+            self.misses = 0
+            self.shared_hits = 0
+
+    def info(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+stats_cache = StatsCache(STATS_CACHE_TTL, STATS_CACHE_MAX_ENTRIES, STATS_CACHE_REDIS_URL)
 
 def update_player_stats(player_id: str, role: str, result: str):
     """
@@ -22,53 +312,54 @@ def update_player_stats(player_id: str, role: str, result: str):
     role: "TIGER" or "GOAT"
     result: "WIN", "LOSS", "DRAW"
     """
-    if not db or not player_id or player_id == "AI":
+    if not player_id or player_id == "AI":
         return
 
-    doc_ref = db.collection("users").document(player_id)
-    
-    # We use a transaction or simple increment. 
-    # Since we might be creating the doc, set with merge is good, 
-    # but for atomic increments, we need to know the field names.
-    
-    updates = {}
-    
+    increments = {}
+
     # Total stats
     if result == "WIN":
-        updates["total_wins"] = firestore.Increment(1)
+        increments["total_wins"] = 1
     elif result == "LOSS":
-        updates["total_losses"] = firestore.Increment(1)
+        increments["total_losses"] = 1
     elif result == "DRAW":
-        updates["total_draws"] = firestore.Increment(1)
-        
+        increments["total_draws"] = 1
+
     # Role specific stats
     prefix = role.lower() # tiger or goat
-    
+
     # Fix for pluralization: "loss" -> "losses", others add "s"
     suffix = "losses" if result == "LOSS" else f"{result.lower()}s"
     key = f"{prefix}_{suffix}"
-    
-    updates[key] = firestore.Increment(1)
-    
+
+    increments[key] = 1
+
     try:
-        doc_ref.set(updates, merge=True)
-        print(f"Updated stats for {player_id}: {updates}")
+        get_stats_backend().increment(player_id, increments)
+        stats_cache.apply_increments(player_id, increments)
+        print(f"Updated stats for {player_id}: {increments}")
     except Exception as e:
+        # The write may or may not have landed, so don't trust the cached copy.
+        stats_cache.invalidate(player_id)
         print(f"Error updating stats for {player_id}: {e}")
 
 def get_player_stats(player_id: str):
     """
-    Fetch stats for a player.
+    Fetch stats for a player, served from the stats cache when possible.
     """
-    if not db or not player_id:
+    if not player_id:
         return None
 
+    cached = stats_cache.get(player_id)
+    if cached is not None:
+        return cached
+
     try:
-        doc = db.collection("users").document(player_id).get()
-        if doc.exists:
-            return doc.to_dict()
-        else:
-            return {}
+        generation = stats_cache.generation(player_id)
+        stats = get_stats_backend().get(player_id)
+        if stats is not None:
+            stats_cache.set(player_id, stats, generation)
+        return stats
     except Exception as e:
         print(f"Error fetching stats for {player_id}: {e}")
         return None
@@ -1,5 +1,4 @@
 import uuid
-import math
 import random
 from typing import List, Dict, Optional, Tuple
 from backend.models import GameState, Move
@@ -11,7 +10,12 @@ from backend.models import GameState, Move
 # - Goats in hand (0-15)
 # - Goats killed (0-5)
 
+# Fixed seed: hashes must agree across processes (AI and analysis workers
+# are spawned, not forked, and compare against history built by the server)
+ZOBRIST_SEED = 0x5A0B15
+
 def _generate_zobrist_keys():
+    rng = random.Random(ZOBRIST_SEED)
     keys = {
         "PIECES": {},
         "TURN": {},
@@ -21,25 +25,36 @@ def _generate_zobrist_keys():
     
     # Pieces: (node_index, piece_type) -> random_int
     for i in range(23):
-        keys["PIECES"][(i, "T")] = random.getrandbits(64)
-        keys["PIECES"][(i, "G")] = random.getrandbits(64)
+        keys["PIECES"][(i, "T")] = rng.getrandbits(64)
+        keys["PIECES"][(i, "G")] = rng.getrandbits(64)
         
     # Turn
-    keys["TURN"]["TIGER"] = random.getrandbits(64)
-    keys["TURN"]["GOAT"] = random.getrandbits(64)
+    keys["TURN"]["TIGER"] = rng.getrandbits(64)
+    keys["TURN"]["GOAT"] = rng.getrandbits(64)
     
     # Goats in Hand
     for i in range(16):
-        keys["GOATS_HAND"][i] = random.getrandbits(64)
+        keys["GOATS_HAND"][i] = rng.getrandbits(64)
         
     # Goats Killed
     for i in range(6):
-        keys["GOATS_KILLED"][i] = random.getrandbits(64)
+        keys["GOATS_KILLED"][i] = rng.getrandbits(64)
         
     return keys
 
 ZOBRIST_KEYS = _generate_zobrist_keys()
 
+def compute_zobrist_hash(board: List[str], active_player: str, goats_in_hand: int, goats_killed: int) -> str:
+    """Hash a position from scratch (the engine otherwise updates it incrementally)."""
+    h = 0
+    for i, piece in enumerate(board):
+        if piece != "E":
+            h ^= ZOBRIST_KEYS["PIECES"][(i, piece)]
+    h ^= ZOBRIST_KEYS["TURN"][active_player]
+    h ^= ZOBRIST_KEYS["GOATS_HAND"][goats_in_hand]
+    h ^= ZOBRIST_KEYS["GOATS_KILLED"][goats_killed]
+    return hex(h)
+
 # Node coordinates for the 23-node board (Custom Variant)
 # Calculated based on a perspective "Fan" projection where lines diverge from Node 0 (or virtual apex).
 NODE_COORDINATES = {
@@ -97,33 +112,87 @@ JUMP_LINES = [
     [6, 12, 18]             # Right Wing
 ]
 
+def _build_jump_table() -> List[Tuple[int, int, int]]:
+    jumps = []
+    # Iterate over all defined lines
+    for line in JUMP_LINES:
+        # Check forward jumps
+        for i in range(len(line) - 2):
+            start, over, land = line[i], line[i+1], line[i+2]
+            jumps.append((start, over, land))
+        # Check backward jumps
+        for i in range(len(line) - 1, 1, -1):
+            start, over, land = line[i], line[i-1], line[i-2]
+            jumps.append((start, over, land))
+
+    # Remove duplicates
+    return list(set(jumps))
+
+# (start, over, land) triples, shared by every engine instance
+JUMP_TABLE = _build_jump_table()
+
+# GameState fields apply_move may change, saved by value in each journal entry
+_JOURNALED_FIELDS = ("activePlayer", "phase", "goatsInHand", "goatsKilled", "zobristHash", "winner", "winReason")
+
+class _JournalEntry:
+    """What one apply_move changed: the old field values and board cells."""
+    __slots__ = ("fields", "cells", "recorded")
+
+    def __init__(self, state: GameState):
+        self.fields = tuple(getattr(state, name) for name in _JOURNALED_FIELDS)
+        # (node, previous piece) in the order they were overwritten
+        self.cells: List[Tuple[int, str]] = []
+        # Set once the move has been appended to history and moves
+        self.recorded = False
+
 class GameEngine:
     def __init__(self, variant: str = "3T-15G-23N", state: Optional[GameState] = None):
         self.adjacency_map = ADJACENCY_MAP
         self.jump_table = self._build_jump_table()
+        # Moves accepted by this engine instance, in order (used for game records)
+        self.moves: List[Move] = []
+        # Bumped on every state change; keys the cached snapshot and legal moves
+        self.version = 0
+        self._snapshot: Optional[Tuple[int, bytes]] = None
+        self._legal_moves: Optional[Tuple[int, List[Move]]] = None
+        # One journal entry per move played, newest last (see undo_move)
+        self._journal: List[_JournalEntry] = []
+        # (history list, hash -> occurrences), for the repetition check
+        self._repetitions: Optional[Tuple[List[str], Dict[str, int]]] = None
         if state:
             self.state = state
         else:
             self.state = self._initialize_state(variant)
 
+    def bump_version(self):
+        """Mark the state as changed. Call after mutating self.state outside apply_move."""
+        self.version += 1
+
+    def snapshot_json(self) -> bytes:
+        """The state serialized to JSON, cached until the next version."""
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            try:
+                data = self.state.model_dump_json().encode("utf-8")
+            except AttributeError:
+                data = self.state.json().encode("utf-8")
+            self._snapshot = (self.version, data)
+        return self._snapshot[1]
+
+    def legal_moves(self) -> List[Move]:
+        """Moves for the side to move, cached until the next version. Empty once the game is over."""
+        if self._legal_moves is None or self._legal_moves[0] != self.version:
+            if self.state.phase == "GAME_OVER":
+                moves = []
+            else:
+                moves = self.get_valid_moves(self.state.activePlayer)
+            self._legal_moves = (self.version, moves)
+        return self._legal_moves[1]
+
     def _build_adjacency_map(self) -> Dict[int, List[int]]:
         return ADJACENCY_MAP
 
     def _build_jump_table(self) -> List[Tuple[int, int, int]]:
-        jumps = []
-        # Iterate over all defined lines
-        for line in JUMP_LINES:
-            # Check forward jumps
-            for i in range(len(line) - 2):
-                start, over, land = line[i], line[i+1], line[i+2]
-                jumps.append((start, over, land))
-            # Check backward jumps
-            for i in range(len(line) - 1, 1, -1):
-                start, over, land = line[i], line[i-1], line[i-2]
-                jumps.append((start, over, land))
-        
-        # Remove duplicates
-        return list(set(jumps))
+        return JUMP_TABLE
 
     def _initialize_state(self, variant: str) -> GameState:
         # Standard 3T-15G start: Tigers at 0, 2, 6 (Spine) or 0, 1, 2 (Apex)
@@ -193,122 +262,147 @@ class GameEngine:
         return moves
 
     def apply_move(self, move: Move):
-        if self.state.winner:
-            raise ValueError("Game is over")
-        
-        if move.player != self.state.activePlayer:
-            raise ValueError(f"Not {move.player}'s turn")
+        """
+        Validate and play `move`. The state is only touched once the move is
+        known to be legal; every change is then journaled, so a failure part
+        way through is rolled back and undo_move can take the move back.
+        """
+        changes, placed, captured = self._validate_move(move)
 
-        # Backup state for rollback
+        entry = _JournalEntry(self.state)
         try:
-            backup_state = self.state.model_copy(deep=True)
-        except AttributeError:
-            import copy
-            backup_state = self.state.copy(deep=True)
+            self._play(move, changes, placed, captured, entry)
+        except Exception:
+            self._rollback(entry)
+            raise
 
-        try:
-            if self.state.phase == "PLACEMENT":
-                self._handle_placement(move)
-            elif self.state.phase == "MOVEMENT":
-                self._handle_movement(move)
-            
-            self._check_win_condition()
-            self._toggle_turn()
-            
-            # Check Repetition (Superko)
-            if self.state.history.count(self.state.zobristHash) >= 2:
-                self.state.phase = "GAME_OVER"
-                self.state.winReason = "REPETITION"
-                # Winner remains None (Draw)
-            
-            self.state.history.append(self.state.zobristHash)
-            
-        except ValueError as e:
-            self.state = backup_state
-            raise e
+        self._journal.append(entry)
+        self.version += 1
 
-    def _handle_placement(self, move: Move):
-        h = int(self.state.zobristHash, 16)
+    def undo_move(self) -> Move:
+        """Take back the last move played through this engine and return it."""
+        if not self._journal:
+            raise ValueError("No move to undo")
+        move = self.moves[-1]
+        self._rollback(self._journal.pop())
+        self.version += 1
+        return move
+
+    def _validate_move(self, move: Move) -> Tuple[List[Tuple[int, str]], bool, bool]:
+        """
+        Check `move` against the current position without changing it.
+        Returns the board changes as (node, piece) pairs and whether the move
+        places a goat and captures one.
+        """
+        if self.state.winner or self.state.phase == "GAME_OVER":
+            raise ValueError("Game is over")
 
-        if move.player == "GOAT":
+        if move.player != self.state.activePlayer:
+            raise ValueError(f"Not {move.player}'s turn")
+
+        board = self.state.board
+        if not 0 <= move.to_node < len(board) or (move.from_node is not None and not 0 <= move.from_node < len(board)):
+            raise ValueError("Node out of range")
+
+        if self.state.phase == "PLACEMENT" and move.player == "GOAT":
             if move.from_node is not None:
                 raise ValueError("Goats cannot move during placement, only place")
-            if self.state.board[move.to_node] != "E":
+            if board[move.to_node] != "E":
                 raise ValueError("Target node is not empty")
-            
-            # Update Hash: Remove old goatsInHand, Add new goatsInHand
-            h ^= ZOBRIST_KEYS["GOATS_HAND"][self.state.goatsInHand]
-            self.state.goatsInHand -= 1
-            h ^= ZOBRIST_KEYS["GOATS_HAND"][self.state.goatsInHand]
-
-            self.state.board[move.to_node] = "G"
-            # Update Hash: Add Goat to board
-            h ^= ZOBRIST_KEYS["PIECES"][(move.to_node, "G")]
-            
-            self.state.zobristHash = hex(h)
-            
-        elif move.player == "TIGER":
-            # Tigers can move during placement
-            self._handle_movement(move)
-
-    def _handle_movement(self, move: Move):
-        h = int(self.state.zobristHash, 16)
+            return [(move.to_node, "G")], True, False
 
+        # Movement phase, or a tiger during placement
         if move.from_node is None:
             raise ValueError("Source node required for movement")
-        
-        piece = self.state.board[move.from_node]
+
+        piece = board[move.from_node]
         if (move.player == "TIGER" and piece != "T") or (move.player == "GOAT" and piece != "G"):
             raise ValueError("Invalid piece selection")
-            
-        if self.state.board[move.to_node] != "E":
+
+        if board[move.to_node] != "E":
             raise ValueError("Target node is not empty")
 
-        # Check Adjacency
+        # Simple move
         if move.to_node in self.adjacency_map[move.from_node]:
-            # Simple Move
-            # Remove piece from source
-            h ^= ZOBRIST_KEYS["PIECES"][(move.from_node, piece)]
-            self.state.board[move.from_node] = "E"
-            
-            # Add piece to target
-            self.state.board[move.to_node] = piece
-            h ^= ZOBRIST_KEYS["PIECES"][(move.to_node, piece)]
-            
-            self.state.zobristHash = hex(h)
-            return
+            return [(move.from_node, "E"), (move.to_node, piece)], False, False
 
-        # Check Jump (Tiger only)
+        # Jump (Tiger only)
         if move.player == "TIGER":
             for start, over, land in self.jump_table:
                 if start == move.from_node and land == move.to_node:
-                    if self.state.board[over] == "G":
-                        # Valid Kill
-                        # Remove Tiger from source
-                        h ^= ZOBRIST_KEYS["PIECES"][(move.from_node, "T")]
-                        self.state.board[move.from_node] = "E"
-                        
-                        # Remove Goat from over
-                        h ^= ZOBRIST_KEYS["PIECES"][(over, "G")]
-                        self.state.board[over] = "E" # Remove Goat
-                        
-                        # Add Tiger to target
-                        h ^= ZOBRIST_KEYS["PIECES"][(move.to_node, "T")]
-                        self.state.board[move.to_node] = "T"
-                        
-                        # Update Goats Killed
-                        h ^= ZOBRIST_KEYS["GOATS_KILLED"][self.state.goatsKilled]
-                        self.state.goatsKilled += 1
-                        h ^= ZOBRIST_KEYS["GOATS_KILLED"][self.state.goatsKilled]
-                        
-                        self.state.zobristHash = hex(h)
-                        return
-                    else:
-                        raise ValueError("Must jump over a Goat")
+                    if board[over] == "G":
+                        return [(move.from_node, "E"), (over, "E"), (move.to_node, "T")], False, True
+                    raise ValueError("Must jump over a Goat")
             raise ValueError("Invalid move or jump")
-        
+
         raise ValueError("Invalid move")
 
+    def _play(self, move: Move, changes: List[Tuple[int, str]], placed: bool, captured: bool, entry: "_JournalEntry"):
+        state = self.state
+        h = int(state.zobristHash, 16)
+
+        for node, piece in changes:
+            old = state.board[node]
+            entry.cells.append((node, old))
+            if old != "E":
+                h ^= ZOBRIST_KEYS["PIECES"][(node, old)]
+            if piece != "E":
+                h ^= ZOBRIST_KEYS["PIECES"][(node, piece)]
+            state.board[node] = piece
+
+        if placed:
+            h ^= ZOBRIST_KEYS["GOATS_HAND"][state.goatsInHand]
+            state.goatsInHand -= 1
+            h ^= ZOBRIST_KEYS["GOATS_HAND"][state.goatsInHand]
+        if captured:
+            h ^= ZOBRIST_KEYS["GOATS_KILLED"][state.goatsKilled]
+            state.goatsKilled += 1
+            h ^= ZOBRIST_KEYS["GOATS_KILLED"][state.goatsKilled]
+        state.zobristHash = hex(h)
+
+        self._check_win_condition()
+        self._toggle_turn()
+
+        # Check Repetition (Superko)
+        counts = self._position_counts()
+        if counts.get(state.zobristHash, 0) >= 2:
+            state.phase = "GAME_OVER"
+            state.winReason = "REPETITION"
+            # Winner remains None (Draw)
+
+        state.history.append(state.zobristHash)
+        counts[state.zobristHash] = counts.get(state.zobristHash, 0) + 1
+        self.moves.append(move)
+        entry.recorded = True
+
+    def _rollback(self, entry: "_JournalEntry"):
+        state = self.state
+        if entry.recorded:
+            key = state.history.pop()
+            counts = self._position_counts()
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+            self.moves.pop()
+        for node, piece in reversed(entry.cells):
+            state.board[node] = piece
+        for name, value in zip(_JOURNALED_FIELDS, entry.fields):
+            setattr(state, name, value)
+
+    def _position_counts(self) -> Dict[str, int]:
+        """
+        How often each hash occurs in state.history, kept in step by
+        apply_move and undo_move. Rebuilt if the state (or its history list)
+        was replaced since the last move.
+        """
+        history = self.state.history
+        if self._repetitions is None or self._repetitions[0] is not history:
+            counts: Dict[str, int] = {}
+            for key in history:
+                counts[key] = counts.get(key, 0) + 1
+            self._repetitions = (history, counts)
+        return self._repetitions[1]
+
     def _toggle_turn(self):
         h = int(self.state.zobristHash, 16)
         
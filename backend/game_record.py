@@ -0,0 +1,247 @@
+"""
+Compact binary game records.
+
+Every move is stored as a single byte: an index into MOVE_TABLE, which lists
+all goat placements (one per node) followed by every (from, to) step or jump
+the board allows. The player who made a move is implied by the turn order, so
+a record can always be replayed through GameEngine to reconstruct the game.
+
+File layout (append-only, so finished games can be streamed to disk):
+
+    header:  b"APGR" + format version (1 byte)
+    records: <I body length> + body
+
+    body:    matchId (16 byte UUID; other match ids can't be recorded)
+             finishedAt (<I unix seconds)
+             winner (1 byte, index into WINNERS)
+             winReason (1 byte, index into WIN_REASONS)
+             goatsKilled (1 byte)
+             tigerPlayerId, goatPlayerId (1 byte length + UTF-8 each)
+             moves (1 byte each, until the end of the body)
+
+Run from the repository root:
+    python -m backend.game_record generate games.apgr [count]
+    python -m backend.game_record replay games.apgr
+"""
+import os
+import random
+import struct
+import sys
+import time
+import uuid
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from backend.game_engine import GameEngine, ADJACENCY_MAP, JUMP_TABLE
+from backend.models import GameState, Move
+
+FILE_MAGIC = b"APGR"
+FORMAT_VERSION = 1
+
+WINNERS = [None, "TIGER", "GOAT"]
+WIN_REASONS = [None, "CAPTURE_LIMIT", "STALEMATE", "FORFEIT", "REPETITION", "OPPONENT_DISCONNECTED"]
+
+_RECORD_HEADER = struct.Struct("<16sIBBB")
+_LENGTH = struct.Struct("<I")
+
+def _build_move_table() -> List[Tuple[Optional[int], int]]:
+    # Placements first, so the code of a placement is simply its node index.
+    table: List[Tuple[Optional[int], int]] = [(None, node) for node in range(len(ADJACENCY_MAP))]
+    steps = set()
+    for start, neighbors in ADJACENCY_MAP.items():
+        for neighbor in neighbors:
+            steps.add((start, neighbor))
+    for start, over, land in JUMP_TABLE:
+        steps.add((start, land))
+    table.extend(sorted(steps))
+    return table
+
+# code -> (from_node, to_node); from_node is None for placements
+MOVE_TABLE = _build_move_table()
+MOVE_CODES: Dict[Tuple[Optional[int], int], int] = {move: code for code, move in enumerate(MOVE_TABLE)}
+
+assert len(MOVE_TABLE) <= 256, "Move codes must fit in a single byte"
+
+# Move objects are never mutated by the engine, so replays can share them.
+_REPLAY_MOVES: Dict[Tuple[int, str], Move] = {}
+
+def encode_move(move: Move) -> int:
+    try:
+        return MOVE_CODES[(move.from_node, move.to_node)]
+    except KeyError:
+        raise ValueError(f"Move {move.from_node} -> {move.to_node} is not on the board")
+
+def decode_move(code: int, player: str, player_id: str = "REPLAY") -> Move:
+    from_node, to_node = MOVE_TABLE[code]
+    return Move(player=player, from_node=from_node, to_node=to_node, playerId=player_id)
+
+def _replay_move(code: int, player: str) -> Move:
+    move = _REPLAY_MOVES.get((code, player))
+    if move is None:
+        move = decode_move(code, player)
+        _REPLAY_MOVES[(code, player)] = move
+    return move
+
+class GameRecord:
+    __slots__ = ("match_id", "finished_at", "winner", "win_reason", "goats_killed",
+                 "tiger_player_id", "goat_player_id", "moves")
+
+    def __init__(
+        self,
+        match_id: str,
+        moves: bytes,
+        winner: Optional[str] = None,
+        win_reason: Optional[str] = None,
+        goats_killed: int = 0,
+        tiger_player_id: Optional[str] = None,
+        goat_player_id: Optional[str] = None,
+        finished_at: Optional[int] = None,
+    ):
+        self.match_id = match_id
+        self.moves = moves
+        self.winner = winner
+        self.win_reason = win_reason
+        self.goats_killed = goats_killed
+        self.tiger_player_id = tiger_player_id
+        self.goat_player_id = goat_player_id
+        self.finished_at = int(time.time()) if finished_at is None else finished_at
+
+    @classmethod
+    def from_game(cls, game: GameEngine) -> "GameRecord":
+        state = game.state
+        return cls(
+            match_id=state.matchId,
+            moves=bytes(encode_move(m) for m in game.moves),
+            winner=state.winner,
+            win_reason=state.winReason,
+            goats_killed=state.goatsKilled,
+            tiger_player_id=state.tigerPlayerId,
+            goat_player_id=state.goatPlayerId,
+        )
+
+    def to_bytes(self) -> bytes:
+        try:
+            match_uuid = uuid.UUID(self.match_id).bytes
+        except ValueError:
+            raise ValueError(f"Match id {self.match_id!r} is not a UUID")
+        body = bytearray(_RECORD_HEADER.pack(
+            match_uuid,
+            self.finished_at,
+            WINNERS.index(self.winner),
+            WIN_REASONS.index(self.win_reason),
+            self.goats_killed,
+        ))
+        for player_id in (self.tiger_player_id, self.goat_player_id):
+            # Cut to 255 bytes on a character boundary
+            encoded = (player_id or "").encode("utf-8")[:255].decode("utf-8", "ignore").encode("utf-8")
+            body.append(len(encoded))
+            body += encoded
+        body += self.moves
+        return _LENGTH.pack(len(body)) + bytes(body)
+
+    @classmethod
+    def from_body(cls, body: bytes) -> "GameRecord":
+        match_uuid, finished_at, winner, reason, killed = _RECORD_HEADER.unpack_from(body)
+        offset = _RECORD_HEADER.size
+        player_ids = []
+        for _ in range(2):
+            length = body[offset]
+            # Files written before IDs were cut on a character boundary may end mid-character
+            player_ids.append(body[offset + 1:offset + 1 + length].decode("utf-8", "replace") or None)
+            offset += 1 + length
+        return cls(
+            match_id=str(uuid.UUID(bytes=match_uuid)),
+            moves=body[offset:],
+            winner=WINNERS[winner],
+            win_reason=WIN_REASONS[reason],
+            goats_killed=killed,
+            tiger_player_id=player_ids[0],
+            goat_player_id=player_ids[1],
+            finished_at=finished_at,
+        )
+
+    def replay(self) -> GameEngine:
+        """Replay the moves through GameEngine and return the engine at the final position."""
+        engine = GameEngine()
+        engine.state.matchId = self.match_id
+        engine.state.tigerPlayerId = self.tiger_player_id
+        engine.state.goatPlayerId = self.goat_player_id
+        for code in self.moves:
+            engine.apply_move(_replay_move(code, engine.state.activePlayer))
+
+        # Forfeits and disconnects end the game off the board.
+        if engine.state.phase != "GAME_OVER" and self.winner:
+            engine.state.winner = self.winner
+            engine.state.winReason = self.win_reason
+            engine.state.phase = "GAME_OVER"
+        return engine
+
+def _write_header_if_new(f: BinaryIO):
+    if f.tell() == 0:
+        f.write(FILE_MAGIC + bytes([FORMAT_VERSION]))
+
+def append_game_record(path: str, record: GameRecord):
+    with open(path, "ab") as f:
+        _write_header_if_new(f)
+        f.write(record.to_bytes())
+
+def write_game_records(path: str, records) -> int:
+    count = 0
+    with open(path, "ab") as f:
+        _write_header_if_new(f)
+        for record in records:
+            f.write(record.to_bytes())
+            count += 1
+    return count
+
+def read_game_records(path: str) -> Iterator[GameRecord]:
+    """Stream records from a game record file without loading it all into memory."""
+    with open(path, "rb", buffering=1 << 16) as f:
+        header = f.read(len(FILE_MAGIC) + 1)
+        if len(header) < len(FILE_MAGIC) + 1 or header[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f"{path} is not a game record file")
+        if header[-1] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported game record version {header[-1]}")
+
+        while True:
+            prefix = f.read(_LENGTH.size)
+            if not prefix:
+                return
+            if len(prefix) < _LENGTH.size:
+                raise ValueError("Truncated game record file")
+            (length,) = _LENGTH.unpack(prefix)
+            body = f.read(length)
+            if len(body) < length:
+                raise ValueError("Truncated game record file")
+            yield GameRecord.from_body(body)
+
+def play_random_game(rng: random.Random) -> GameEngine:
+    engine = GameEngine()
+    while engine.state.phase != "GAME_OVER":
+        moves = engine.get_valid_moves(engine.state.activePlayer)
+        if not moves:
+            break
+        engine.apply_move(rng.choice(moves))
+    return engine
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("generate", "replay"):
+        print(__doc__)
+        sys.exit(1)
+
+    command, path = sys.argv[1], sys.argv[2]
+
+    if command == "generate":
+        count = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+        rng = random.Random(0)
+        written = write_game_records(path, (GameRecord.from_game(play_random_game(rng)) for _ in range(count)))
+        print(f"Wrote {written} games to {path} ({os.path.getsize(path)} bytes)")
+    else:
+        start = time.perf_counter()
+        games_replayed = 0
+        moves_replayed = 0
+        for record in read_game_records(path):
+            record.replay()
+            games_replayed += 1
+            moves_replayed += len(record.moves)
+        elapsed = time.perf_counter() - start
+        print(f"Replayed {games_replayed} games ({moves_replayed} moves) in {elapsed:.2f}s: "
+              f"{games_replayed / elapsed:.0f} games/s, {moves_replayed / elapsed:.0f} moves/s")
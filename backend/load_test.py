@@ -0,0 +1,377 @@
+"""
+Load-testing harness.
+
+Starts backend.main:app in-process (uvicorn on a background thread, stats
+storage stubbed out) and drives a reproducible scenario against it:
+
+- PvP matches: both players go through /ws/matchmaking/{player_id}, then
+  play random legal moves while listening on /ws/{match_id}, watched by a
+  number of spectator sockets.
+- vs-AI matches: the player creates a game with vsAI and plays Goat.
+
+It reports throughput, latency percentiles per endpoint, broadcast delay
+(move submitted -> state received by every other socket of the match) and
+event-loop lag for both the load generator and the server.
+
+Player moves are drawn from per-match RNGs seeded from --seed, so PvP games
+replay identically. The in-process server also gets AI_SEED=--seed, which
+seeds every AI search from the position, so vs-AI games replay too as long
+as no search runs out of time, is degraded or is over the queue caps.
+Against --url the AI is only reproducible if that server sets AI_SEED
+itself.
+
+Client and server share one process (and the GIL), so absolute numbers are
+pessimistic; use it to compare runs, or point --url at a separate server.
+
+Run from the repository root (requires httpx):
+    python -m backend.load_test --pvp 20 --ai 5 --spectators 2 --seed 1
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# Stats storage is stubbed; set before backend.database is imported.
+os.environ.setdefault("STATS_BACKEND", "none")
+
+import websockets
+from backend.game_engine import GameEngine
+from backend.models import GameState
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.broadcast_delays: List[float] = []
+        self.client_loop_lag: List[float] = []
+        self.server_loop_lag: List[float] = []
+        self.moves = 0
+        self.games_finished = 0
+
+    def observe(self, endpoint: str, seconds: float):
+        self.latencies[endpoint].append(seconds)
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def format_row(label: str, samples: List[float]) -> str:
+    ms = [s * 1000 for s in samples]
+    return (f"  {label:<28} n={len(ms):<6} p50={percentile(ms, 50):8.2f}  p90={percentile(ms, 90):8.2f}  "
+            f"p99={percentile(ms, 99):8.2f}  max={max(ms, default=0):8.2f} ms")
+
+async def measure_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+class MatchSockets:
+    """All sockets of one match, timing when each state broadcast arrives."""
+
+    def __init__(self, recorder: Recorder):
+        self.recorder = recorder
+        # ply -> time the move producing it was submitted
+        self.submitted: Dict[int, float] = {}
+        self.acks: Dict[int, asyncio.Future] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.sockets = []
+
+    async def open(self, url: str):
+        ws = await websockets.connect(url, max_size=None)
+        self.sockets.append(ws)
+        self.tasks.append(asyncio.create_task(self._listen(ws)))
+        return ws
+
+    async def _listen(self, ws):
+        # A forfeit re-broadcasts the last ply; only time the first arrival.
+        seen = set()
+        try:
+            async for raw in ws:
+                data = json.loads(raw)
+                if "type" in data:
+                    future = self.acks.pop(data.get("seq"), None)
+                    if future is not None and not future.done():
+                        future.set_result(data)
+                    continue
+                ply = len(data.get("history", [])) - 1
+                submitted = self.submitted.get(ply)
+                if submitted is not None and ply not in seen:
+                    seen.add(ply)
+                    self.recorder.broadcast_delays.append(time.perf_counter() - submitted)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def close(self):
+        for ws in self.sockets:
+            await ws.close()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+class LoadTest:
+    def __init__(self, args, base_url: str, recorder: Recorder):
+        self.args = args
+        self.base_url = base_url
+        self.ws_url = "ws" + base_url[len("http"):]
+        self.recorder = recorder
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=60)
+
+    async def timed_request(self, endpoint: str, method: str, path: str, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, path, **kwargs)
+        self.recorder.observe(endpoint, time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.recorder.errors[endpoint] += 1
+        return response
+
+    async def join_matchmaking(self, player_ids: List[str]) -> List[Tuple[str, str]]:
+        # Connect in a fixed order so the FIFO queue pairs the same players every run.
+        sockets = []
+        for player_id in player_ids:
+            sockets.append((time.perf_counter(), await websockets.connect(f"{self.ws_url}/ws/matchmaking/{player_id}")))
+
+        async def wait_for_match(start: float, ws) -> Tuple[str, str]:
+            async with ws:
+                message = json.loads(await ws.recv())
+            self.recorder.observe("WS matchmaking (wait)", time.perf_counter() - start)
+            return message["matchId"], message["role"]
+
+        return await asyncio.gather(*(wait_for_match(start, ws) for start, ws in sockets))
+
+    async def submit_move(self, sockets: MatchSockets, ws, match_id: str, move, ply: int, seq: int) -> Optional[dict]:
+        payload = {"player": move.player, "from_node": move.from_node, "to_node": move.to_node, "playerId": move.playerId}
+        sockets.submitted[ply] = time.perf_counter()
+
+        if self.args.ws_moves:
+            future = asyncio.get_running_loop().create_future()
+            sockets.acks[seq] = future
+            start = time.perf_counter()
+            await ws.send(json.dumps({"type": "MOVE", "seq": seq, "move": payload}))
+            reply = await asyncio.wait_for(future, timeout=60)
+            self.recorder.observe("WS move (ack)", time.perf_counter() - start)
+            if reply["type"] != "MOVE_ACK":
+                self.recorder.errors["WS move (ack)"] += 1
+                return None
+            return reply
+
+        response = await self.timed_request("POST /api/games/{id}/move", "POST", f"/api/games/{match_id}/move", json=payload)
+        return response.json() if response.status_code == 200 else None
+
+    async def play_pvp_match(self, match_id: str, players: Dict[str, str], rng: random.Random):
+        sockets = MatchSockets(self.recorder)
+        player_sockets = {}
+        for role, player_id in players.items():
+            player_sockets[role] = await sockets.open(f"{self.ws_url}/ws/{match_id}?playerId={player_id}")
+        for _ in range(self.args.spectators):
+            await sockets.open(f"{self.ws_url}/ws/{match_id}")
+
+        response = await self.timed_request("GET /api/games/{id}", "GET", f"/api/games/{match_id}")
+        state = GameState(**response.json())
+
+        seq = 0
+        for _ in range(self.args.max_moves):
+            if state.phase == "GAME_OVER":
+                break
+            role = state.activePlayer
+            moves = GameEngine(state=state).get_valid_moves(role)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            move.playerId = players[role]
+            seq += 1
+            ply = len(state.history)
+            result = await self.submit_move(sockets, player_sockets[role], match_id, move, ply, seq)
+            if result is None:
+                break
+            self.recorder.moves += 1
+
+            if self.args.ws_moves:
+                response = await self.timed_request("GET /api/games/{id}", "GET", f"/api/games/{match_id}")
+                state = GameState(**response.json())
+            else:
+                state = GameState(**result)
+
+        if state.phase == "GAME_OVER":
+            self.recorder.games_finished += 1
+        await sockets.close()
+
+    async def play_ai_match(self, index: int, rng: random.Random):
+        player_id = f"load-ai-{index}"
+        response = await self.timed_request("POST /api/games", "POST", "/api/games",
+                                            json={"playerId": player_id, "preferredRole": "GOAT", "vsAI": True})
+        state = GameState(**response.json())
+        match_id = state.matchId
+
+        sockets = MatchSockets(self.recorder)
+        player_ws = await sockets.open(f"{self.ws_url}/ws/{match_id}?playerId={player_id}")
+        for _ in range(self.args.spectators):
+            await sockets.open(f"{self.ws_url}/ws/{match_id}")
+
+        seq = 0
+        for _ in range(self.args.max_moves):
+            if state.phase == "GAME_OVER" or state.activePlayer != "GOAT":
+                break
+            moves = GameEngine(state=state).get_valid_moves("GOAT")
+            if not moves:
+                break
+            move = rng.choice(moves)
+            move.playerId = player_id
+            seq += 1
+            result = await self.submit_move(sockets, player_ws, match_id, move, len(state.history), seq)
+            if result is None:
+                break
+            self.recorder.moves += 1
+
+            if not self.args.ws_moves:
+                # The HTTP response already includes the AI's reply.
+                state = GameState(**result)
+                continue
+
+            # Over the websocket only our move is acked; poll until the AI has replied.
+            while True:
+                response = await self.timed_request("GET /api/games/{id}", "GET", f"/api/games/{match_id}")
+                state = GameState(**response.json())
+                if state.activePlayer == "GOAT" or state.phase == "GAME_OVER":
+                    break
+                await asyncio.sleep(0.01)
+
+        if state.phase == "GAME_OVER":
+            self.recorder.games_finished += 1
+        await sockets.close()
+
+    async def run(self):
+        rng = random.Random(self.args.seed)
+
+        # Matchmaking: everyone queues up, then the server decides the pairings.
+        player_ids = [f"load-pvp-{i}" for i in range(self.args.pvp * 2)]
+        pairings = await self.join_matchmaking(player_ids)
+        matches: Dict[str, Dict[str, str]] = defaultdict(dict)
+        for player_id, (match_id, role) in zip(player_ids, pairings):
+            matches[match_id][role] = player_id
+
+        # One RNG per match, seeded in a fixed order, keeps move choices reproducible.
+        match_order = sorted(matches, key=lambda m: min(matches[m].values()))
+        tasks = [self.play_pvp_match(m, matches[m], random.Random(rng.random())) for m in match_order]
+        tasks += [self.play_ai_match(i, random.Random(rng.random())) for i in range(self.args.ai)]
+        await asyncio.gather(*tasks)
+        await self.client.aclose()
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_in_process_server(seed: int) -> Tuple[str, asyncio.AbstractEventLoop, object]:
+    # Read by backend.ai_scheduler on import; searches run in worker processes,
+    # so seeding this process's RNG would not reach them.
+    os.environ["AI_SEED"] = str(seed)
+    import uvicorn
+    from backend.database import set_stats_backend, NullStatsBackend
+    from backend.main import app
+
+    set_stats_backend(NullStatsBackend())
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_until_complete, args=(server.serve(),), daemon=True)
+    thread.start()
+
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("In-process server did not start")
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", loop, server
+
+async def main(args):
+    recorder = Recorder()
+    server_loop = server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        base_url, server_loop, server = start_in_process_server(args.seed)
+
+    stop = asyncio.Event()
+    server_stop = asyncio.Event()
+    client_probe = asyncio.create_task(measure_loop_lag(recorder.client_loop_lag, stop))
+    server_probe = None
+    if server_loop is not None:
+        server_probe = asyncio.run_coroutine_threadsafe(
+            measure_loop_lag(recorder.server_loop_lag, server_stop), server_loop)
+
+    start = time.perf_counter()
+    await LoadTest(args, base_url, recorder).run()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await client_probe
+    if server_probe is not None:
+        server_loop.call_soon_threadsafe(server_stop.set)
+        server_probe.result(timeout=5)
+        server.should_exit = True
+
+    return recorder, elapsed
+
+def report(args, recorder: Recorder, elapsed: float):
+    print(f"\nScenario: {args.pvp} PvP + {args.ai} vs-AI matches, {args.spectators} spectators each, "
+          f"moves over {'websocket' if args.ws_moves else 'HTTP'}, seed {args.seed}")
+    print(f"Elapsed: {elapsed:.2f}s  moves: {recorder.moves} ({recorder.moves / elapsed:.1f}/s)  "
+          f"finished games: {recorder.games_finished}")
+
+    print("\nLatency per endpoint:")
+    for endpoint in sorted(recorder.latencies):
+        print(format_row(endpoint, recorder.latencies[endpoint]))
+    if recorder.errors:
+        print("\nErrors per endpoint:")
+        for endpoint, count in sorted(recorder.errors.items()):
+            print(f"  {endpoint:<28} {count}")
+
+    print("\nBroadcast delay (move submitted -> state received):")
+    print(format_row("all sockets", recorder.broadcast_delays))
+    print("\nEvent-loop lag:")
+    print(format_row("load generator", recorder.client_loop_lag))
+    if recorder.server_loop_lag:
+        print(format_row("server", recorder.server_loop_lag))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the game server")
+    parser.add_argument("--pvp", type=int, default=10, help="Player-vs-player matches (via matchmaking)")
+    parser.add_argument("--ai", type=int, default=2, help="Player-vs-AI matches")
+    parser.add_argument("--spectators", type=int, default=2, help="Spectator sockets per match")
+    parser.add_argument("--max-moves", type=int, default=200, help="Move cap per match")
+    parser.add_argument("--ws-moves", action="store_true", help="Submit moves over the match websocket instead of HTTP")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Target an already running server instead of an in-process one")
+    parser.add_argument("--verbose", action="store_true", help="Keep server logging")
+    args = parser.parse_args()
+
+    if httpx is None:
+        print("The load test needs httpx: pip install httpx")
+        sys.exit(1)
+
+    if args.verbose:
+        recorder, elapsed = asyncio.run(main(args))
+    else:
+        # The server prints on every connect/move; keep the report readable.
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            recorder, elapsed = asyncio.run(main(args))
+    report(args, recorder, elapsed)
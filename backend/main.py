@@ -1,18 +1,38 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, PlainTextResponse, Response, JSONResponse
 import os
+import json
 import asyncio
-from pydantic import BaseModel
-from typing import List, Optional, Literal, Dict
+import random
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional, Literal, Dict, Tuple
 from backend.game_engine import GameEngine
-from backend.ai_engine import AIEngine
-from backend.models import GameState, Move
+from backend.ai_scheduler import ai_scheduler
+from backend.models import GameState, Move, Position
 from backend.database import update_player_stats, get_player_stats
+from backend.matchmaking import MatchmakingQueue, QueueEntry
+from backend.game_record import GameRecord, append_game_record
+from backend import metrics
+from backend.analysis import analyze_positions, start_pool, shutdown_pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Worker pools are created here, before any client socket is open
+    ai_scheduler.start()
+    start_pool()
+    try:
+        yield
+    finally:
+        ai_scheduler.shutdown()
+        shutdown_pool()
+        shutdown_record_writer()
 
-app = FastAPI(title="Aadu Puli Aattam Engine")
+app = FastAPI(title="Aadu Puli Aattam Engine", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,7 +44,31 @@ app.add_middleware(
 
 # In-memory store for games
 games: Dict[str, GameEngine] = {}
-ai_engine = AIEngine()
+
+# Optional file that finished games are appended to (see backend/game_record.py)
+GAME_RECORD_PATH = os.environ.get("GAME_RECORD_PATH")
+
+# Appends game records off the event loop; one thread keeps them in order
+_record_writer: Optional[ThreadPoolExecutor] = None
+
+def _write_game_record(record: GameRecord):
+    try:
+        append_game_record(GAME_RECORD_PATH, record)
+    except Exception as e:
+        print(f"Error recording game {record.match_id}: {e}")
+
+def queue_game_record(record: GameRecord):
+    global _record_writer
+    if _record_writer is None:
+        _record_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="game-records")
+    _record_writer.submit(_write_game_record, record)
+
+def shutdown_record_writer():
+    """Flush queued records; called on app shutdown."""
+    global _record_writer
+    if _record_writer is not None:
+        _record_writer.shutdown(wait=True)
+        _record_writer = None
 
 class ConnectionManager:
     def __init__(self):
@@ -53,12 +97,26 @@ class ConnectionManager:
         return any(c["pid"] == player_id for c in self.active_connections[match_id])
 
     async def broadcast(self, match_id: str, message: dict):
+        await self._send_all(match_id, json.dumps(message))
+
+    async def broadcast_state(self, match_id: str, game: GameEngine):
+        # Reuses the snapshot cached for this version instead of re-encoding per update.
+        await self._send_all(match_id, game.snapshot_json().decode("utf-8"))
+
+    async def _send_all(self, match_id: str, text: str):
         if match_id in self.active_connections:
-            for connection in self.active_connections[match_id]:
-                try:
-                    await connection["ws"].send_json(message)
-                except Exception as e:
-                    print(f"Error broadcasting to client: {e}")
+            connections = self.active_connections[match_id]
+            with metrics.timer(metrics.BROADCAST_SECONDS):
+                for connection in connections:
+                    try:
+                        await connection["ws"].send_text(text)
+                    except Exception as e:
+                        print(f"Error broadcasting to client: {e}")
+            if metrics.METRICS_ENABLED:
+                metrics.BROADCAST_RECIPIENTS.inc(len(connections))
+
+    def socket_count(self) -> int:
+        return sum(len(c) for c in self.active_connections.values())
 
 manager = ConnectionManager()
 
@@ -84,67 +142,70 @@ async def handle_disconnection(match_id: str, player_id: str):
                     game.state.winner = winner
                     game.state.winReason = "OPPONENT_DISCONNECTED"
                     game.state.phase = "GAME_OVER"
+                    game.bump_version()
                     process_game_result(game)
-                    await manager.broadcast(match_id, jsonable_encoder(game.state))
+                    await manager.broadcast_state(match_id, game)
     else:
         print(f"Player {player_id} reconnected to {match_id}.")
 
-class MatchmakingQueue:
-    def __init__(self):
-        self.queue: List[Dict] = [] # List of {"websocket": WebSocket, "playerId": str}
-
-    async def add_player(self, websocket: WebSocket, player_id: str):
-        await websocket.accept()
-        # Check if player is already in queue to avoid duplicates
-        if any(p["playerId"] == player_id for p in self.queue):
-             # If same socket, ignore. If different, maybe remove old? 
-             # For now, let's just append. The disconnect handler will clean up.
-             pass
-             
-        self.queue.append({"websocket": websocket, "playerId": player_id})
-        print(f"Player {player_id} added to matchmaking queue. Queue size: {len(self.queue)}")
-        await self.check_match()
-
-    def remove_player(self, websocket: WebSocket):
-        self.queue = [p for p in self.queue if p["websocket"] != websocket]
-        print(f"Player removed from matchmaking queue. Queue size: {len(self.queue)}")
-
-    async def check_match(self):
-        if len(self.queue) >= 2:
-            player1 = self.queue.pop(0)
-            player2 = self.queue.pop(0)
-            
-            # Create Game
-            game = GameEngine("3T-15G-23N")
-            game.state.tigerPlayerId = player1["playerId"]
-            game.state.goatPlayerId = player2["playerId"]
-            games[game.state.matchId] = game
-            
-            print(f"Match found! {game.state.matchId}: {player1['playerId']} vs {player2['playerId']}")
+async def start_matched_game(player1: QueueEntry, player2: QueueEntry):
+    # Create Game
+    game = GameEngine("3T-15G-23N")
+    game.state.tigerPlayerId = player1.player_id
+    game.state.goatPlayerId = player2.player_id
+    games[game.state.matchId] = game
 
-            # Notify Player 1
-            try:
-                await player1["websocket"].send_json({
-                    "status": "MATCH_FOUND",
-                    "matchId": game.state.matchId,
-                    "role": "TIGER"
-                })
-                await player1["websocket"].close()
-            except Exception as e:
-                print(f"Error notifying player 1: {e}")
-
-            # Notify Player 2
-            try:
-                await player2["websocket"].send_json({
-                    "status": "MATCH_FOUND",
-                    "matchId": game.state.matchId,
-                    "role": "GOAT"
-                })
-                await player2["websocket"].close()
-            except Exception as e:
-                print(f"Error notifying player 2: {e}")
+    print(f"Match found! {game.state.matchId}: {player1.player_id} vs {player2.player_id}")
 
-matchmaking_queue = MatchmakingQueue()
+    # Notify Player 1
+    try:
+        await player1.websocket.send_json({
+            "status": "MATCH_FOUND",
+            "matchId": game.state.matchId,
+            "role": "TIGER"
+        })
+        await player1.websocket.close()
+    except Exception as e:
+        print(f"Error notifying player 1: {e}")
+
+    # Notify Player 2
+    try:
+        await player2.websocket.send_json({
+            "status": "MATCH_FOUND",
+            "matchId": game.state.matchId,
+            "role": "GOAT"
+        })
+        await player2.websocket.close()
+    except Exception as e:
+        print(f"Error notifying player 2: {e}")
+
+matchmaking_queue = MatchmakingQueue(start_matched_game)
+
+# Gauges are computed when /metrics is scraped, so they cost nothing in between.
+metrics.ACTIVE_GAMES.set_function(lambda: sum(1 for g in games.values() if g.state.phase != "GAME_OVER"))
+metrics.ACTIVE_SOCKETS.set_function(manager.socket_count)
+metrics.MATCHMAKING_QUEUE_DEPTH.set_function(lambda: len(matchmaking_queue))
+metrics.AI_QUEUE_DEPTH.set_function(lambda: ai_scheduler.waiting)
+
+def state_etag(game: GameEngine) -> str:
+    return f'"{game.version}"'
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def state_response(game: GameEngine, if_none_match: Optional[str] = None) -> Response:
+    """
+    Serve the cached JSON snapshot of the game with its version as ETag, or
+    304 Not Modified if the client already has this version.
+    """
+    etag = state_etag(game)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=game.snapshot_json(), media_type="application/json", headers=headers)
 
 class CreateGameRequest(BaseModel):
     variant: Literal["3T-15G-23N"] = "3T-15G-23N"
@@ -153,7 +214,7 @@ class CreateGameRequest(BaseModel):
     vsAI: bool = False
 
 @app.post("/api/games", response_model=GameState)
-def create_game(request: CreateGameRequest):
+async def create_game(request: CreateGameRequest):
     game = GameEngine(request.variant)
     
     # Assign creator role
@@ -175,15 +236,15 @@ def create_game(request: CreateGameRequest):
     if request.vsAI:
         if (game.state.activePlayer == "TIGER" and game.state.tigerPlayerId == "AI") or \
            (game.state.activePlayer == "GOAT" and game.state.goatPlayerId == "AI"):
-            ai_move = ai_engine.get_best_move(game.state)
+            ai_move = await choose_ai_move(game.state.matchId, game)
             if ai_move:
                 game.apply_move(ai_move)
 
     games[game.state.matchId] = game
-    return game.state
+    return state_response(game)
 
 @app.get("/api/games/{match_id}", response_model=GameState)
-async def get_game(match_id: str, playerId: Optional[str] = None):
+async def get_game(match_id: str, playerId: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
     if match_id not in games:
         raise HTTPException(status_code=404, detail="Game not found")
     
@@ -208,12 +269,35 @@ async def get_game(match_id: str, playerId: Optional[str] = None):
                 pass
             
             if assigned:
-                await manager.broadcast(match_id, jsonable_encoder(game.state))
+                game.bump_version()
+                await manager.broadcast_state(match_id, game)
 
-    return game.state
+    return state_response(game, if_none_match)
 
-@app.post("/api/games/{match_id}/move", response_model=GameState)
-async def make_move(match_id: str, move: Move):
+@app.get("/api/games/{match_id}/moves")
+async def get_legal_moves(match_id: str, if_none_match: Optional[str] = Header(None)):
+    """Legal moves for the side to move, computed once per state version."""
+    if match_id not in games:
+        raise HTTPException(status_code=404, detail="Game not found")
+
+    game = games[match_id]
+    etag = state_etag(game)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(etag, if_none_match):
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse({
+        "version": game.version,
+        "activePlayer": game.state.activePlayer,
+        "phase": game.state.phase,
+        "moves": [{"from_node": m.from_node, "to_node": m.to_node} for m in game.legal_moves()],
+    }, headers=headers)
+
+def apply_player_move(match_id: str, move: Move) -> GameEngine:
+    """
+    Validate and apply a move submitted by a player. Shared by the HTTP and
+    websocket move paths; raises HTTPException when the move is refused.
+    """
     if match_id not in games:
         raise HTTPException(status_code=404, detail="Game not found")
     
@@ -228,42 +312,157 @@ async def make_move(match_id: str, move: Move):
             raise HTTPException(status_code=403, detail="You are not the Goat player")
 
     try:
-        game.apply_move(move)
-        
-        if game.state.phase == "GAME_OVER":
-            process_game_result(game)
+        with metrics.timer(metrics.MOVE_VALIDATION_SECONDS):
+            game.apply_move(move)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Broadcast update
-        await manager.broadcast(match_id, jsonable_encoder(game.state))
+    if game.state.phase == "GAME_OVER":
+        process_game_result(game)
+
+    return game
+
+async def choose_ai_move(match_id: str, game: GameEngine) -> Optional[Move]:
+    """
+    The AI's move for the current position. The scheduler already falls back
+    to a shallow search when a search fails; if even that fails, play a random
+    legal move rather than leave the game waiting on the AI forever.
+    """
+    try:
+        return await ai_scheduler.request_move(match_id, game.state)
+    except Exception as e:
+        print(f"Error choosing AI move in {match_id}: {e!r}; playing a random move")
+        moves = game.legal_moves()
+        return random.choice(moves) if moves else None
+
+async def play_ai_turn(match_id: str, game: GameEngine):
+    # Check if next player is AI
+    next_player = game.state.activePlayer
+    is_ai_turn = False
+    if next_player == "TIGER" and game.state.tigerPlayerId == "AI":
+        is_ai_turn = True
+    elif next_player == "GOAT" and game.state.goatPlayerId == "AI":
+        is_ai_turn = True
         
-        # Check if next player is AI
-        next_player = game.state.activePlayer
-        is_ai_turn = False
-        if next_player == "TIGER" and game.state.tigerPlayerId == "AI":
-            is_ai_turn = True
-        elif next_player == "GOAT" and game.state.goatPlayerId == "AI":
-            is_ai_turn = True
-            
-        if is_ai_turn and not game.state.winner:
-            # AI Turn
-            ai_move = ai_engine.get_best_move(game.state)
-            if ai_move:
-                game.apply_move(ai_move)
-                if game.state.phase == "GAME_OVER":
-                    process_game_result(game)
-                await manager.broadcast(match_id, jsonable_encoder(game.state))
+    if is_ai_turn and not game.state.winner:
+        # AI Turn. The search runs off the event loop, so the game may change
+        # (e.g. a forfeit) while we wait; drop the move if it did.
+        version = game.version
+        ai_move = await choose_ai_move(match_id, game)
+        if ai_move and game.version == version:
+            game.apply_move(ai_move)
+            if game.state.phase == "GAME_OVER":
+                process_game_result(game)
+            await manager.broadcast_state(match_id, game)
 
-        return game.state
+@app.post("/api/games/{match_id}/move", response_model=GameState)
+async def make_move(match_id: str, move: Move):
+    game = apply_player_move(match_id, move)
+
+    try:
+        # Broadcast update
+        await manager.broadcast_state(match_id, game)
+        await play_ai_turn(match_id, game)
+        return state_response(game)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# Last socket move result per player of each game, as (session, seq, reply), so
+# a client that resends a move after a dropped ack, even on a new connection,
+# gets the original answer instead of having the move applied twice. Entries
+# go away with the game.
+socket_move_results: "weakref.WeakKeyDictionary[GameEngine, Dict[str, Tuple[Optional[str], int, Dict]]]" = weakref.WeakKeyDictionary()
+
+async def handle_socket_move(websocket: WebSocket, match_id: str, player_id: Optional[str], message: Dict):
+    """
+    Websocket move protocol.
+
+    Client:  {"type": "MOVE", "session": <str>, "seq": <int>, "move": {"player", "from_node", "to_node"}}
+    Server:  {"type": "MOVE_ACK", "seq", "ply"} once the move is applied, or
+             {"type": "MOVE_REJECTED", "seq", "status", "detail"} with the HTTP
+             status the same move would have got from POST /api/games/{id}/move.
+
+    Sequence numbers increase per player and client session. Resending the
+    last seq replays the original reply, also after reconnecting; anything
+    older is rejected as stale. A client picks a new session id when it
+    starts counting from 1 again (e.g. a page reload), which starts a fresh
+    window. The new state is broadcast to the match as usual.
+    """
+    seq = message.get("seq")
+    if not isinstance(seq, int) or isinstance(seq, bool):
+        await websocket.send_json({"type": "ERROR", "detail": "MOVE requires an integer seq"})
+        return
+
+    payload = message.get("move") or {}
+    pid = player_id or payload.get("playerId")
+    session = message.get("session")
+    if session is not None and not isinstance(session, str):
+        await websocket.send_json({"type": "ERROR", "detail": "MOVE session must be a string"})
+        return
+
+    game = games.get(match_id)
+    results = socket_move_results.setdefault(game, {}) if game is not None else {}
+    previous = results.get(pid)
+    if previous is not None and previous[0] == session:
+        _, last_seq, last_reply = previous
+        if seq == last_seq:
+            await websocket.send_json(last_reply)
+            return
+        if seq < last_seq:
+            await websocket.send_json({"type": "MOVE_REJECTED", "seq": seq, "status": 409, "detail": "Stale sequence number"})
+            return
+
+    try:
+        move = Move(
+            player=payload.get("player"),
+            from_node=payload.get("from_node"),
+            to_node=payload.get("to_node"),
+            playerId=pid,
+        )
+    except ValidationError as e:
+        reply = {"type": "MOVE_REJECTED", "seq": seq, "status": 422, "detail": str(e)}
+        results[pid] = (session, seq, reply)
+        await websocket.send_json(reply)
+        return
+
+    try:
+        game = apply_player_move(match_id, move)
+    except HTTPException as e:
+        reply = {"type": "MOVE_REJECTED", "seq": seq, "status": e.status_code, "detail": e.detail}
+        results[pid] = (session, seq, reply)
+        await websocket.send_json(reply)
+        return
+
+    reply = {"type": "MOVE_ACK", "seq": seq, "ply": len(game.state.history) - 1}
+    results[pid] = (session, seq, reply)
+    await websocket.send_json(reply)
+
+    await manager.broadcast_state(match_id, game)
+    try:
+        await play_ai_turn(match_id, game)
+    except ValueError as e:
+        print(f"Error playing AI move in {match_id}: {e}")
+
 @app.websocket("/ws/{match_id}")
 async def websocket_endpoint(websocket: WebSocket, match_id: str, playerId: Optional[str] = None):
     await manager.connect(websocket, match_id, playerId)
     try:
         while True:
-            await websocket.receive_text()
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                await websocket.send_json({"type": "ERROR", "detail": "Messages must be JSON"})
+                continue
+
+            if isinstance(message, dict) and message.get("type") == "MOVE":
+                await handle_socket_move(websocket, match_id, playerId, message)
+            else:
+                await websocket.send_json({"type": "ERROR", "detail": "Unknown message type"})
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Also on errors, so a failed handler doesn't leave a dead socket in the broadcast list
         manager.disconnect(websocket, match_id)
         if playerId:
             asyncio.create_task(handle_disconnection(match_id, playerId))
@@ -275,6 +474,8 @@ async def matchmaking_endpoint(websocket: WebSocket, player_id: str):
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
+        pass
+    finally:
         matchmaking_queue.remove_player(websocket)
 
 def process_game_result(game: GameEngine):
@@ -298,6 +499,10 @@ def process_game_result(game: GameEngine):
         update_player_stats(tiger_pid, "TIGER", "DRAW")
         update_player_stats(goat_pid, "GOAT", "DRAW")
 
+    if GAME_RECORD_PATH:
+        # The record is a snapshot, so the game can move on while it is written
+        queue_game_record(GameRecord.from_game(game))
+
 @app.get("/api/stats/{player_id}")
 def get_stats(player_id: str):
     stats = get_player_stats(player_id)
@@ -309,6 +514,38 @@ def get_stats(player_id: str):
         }
     return stats
 
+class AnalyzeRequest(BaseModel):
+    position: Optional[Position] = None
+    positions: Optional[List[Position]] = None
+    multiPV: int = 3
+    depth: int = 3
+    timeBudgetMs: int = 1000
+
+@app.post("/api/analyze")
+async def analyze(request: AnalyzeRequest):
+    """
+    Evaluate one position (`position`) or a batch (`positions`). Each result
+    lists the top `multiPV` moves with scores from the side to move's point
+    of view, plus the depth reached and nodes searched within the budget.
+    `timeBudgetMs` is shared by the whole batch.
+    """
+    positions = ([request.position] if request.position else []) + (request.positions or [])
+    if not positions:
+        raise HTTPException(status_code=400, detail="Provide a position or positions")
+
+    try:
+        results = await analyze_positions(positions, request.multiPV, request.depth, request.timeBudgetMs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if request.positions is None:
+        return results[0]
+    return {"results": results}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 # Serve React App (Place this after API routes)
 frontend_dist = os.path.join(os.path.dirname(__file__), "../frontend/dist")
 
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from fastapi import WebSocket
+from backend.database import get_player_stats
+
+# Matchmaking Configuration
+# MATCHMAKING_INTERVAL: seconds between batch matching passes
+# MATCHMAKING_USE_RATING: "1" to pair players with similar win rates
+MATCHMAKING_INTERVAL = float(os.environ.get("MATCHMAKING_INTERVAL", "0.25"))
+MATCHMAKING_USE_RATING = os.environ.get("MATCHMAKING_USE_RATING", "0") == "1"
+
+# Rating window: the allowed win-rate difference starts at BASE and widens by
+# GROWTH per second waited, so nobody waits forever for a close opponent.
+RATING_WINDOW_BASE = 0.1
+RATING_WINDOW_GROWTH = 0.05
+DEFAULT_RATING = 0.5
+
+class QueueEntry:
+    __slots__ = ("player_id", "websocket", "rating", "joined_at", "active")
+
+    def __init__(self, player_id: str, websocket: WebSocket, rating: Optional[float]):
+        self.player_id = player_id
+        self.websocket = websocket
+        self.rating = rating
+        self.joined_at = time.monotonic()
+        self.active = True
+
+    def window(self, now: float) -> float:
+        return RATING_WINDOW_BASE + RATING_WINDOW_GROWTH * (now - self.joined_at)
+
+def win_rate(stats: Optional[Dict]) -> Optional[float]:
+    if not stats:
+        return None
+    wins = stats.get("total_wins", 0)
+    played = wins + stats.get("total_losses", 0) + stats.get("total_draws", 0)
+    if played == 0:
+        return None
+    return wins / played
+
+class MatchmakingQueue:
+    """
+    FIFO matchmaking queue with O(1) join and leave.
+
+    Entries sit in a deque in arrival order and are indexed by player and by
+    socket. Leaving only flags the entry; flagged entries are dropped on the
+    next matching pass. Matching runs as a periodic batch while anyone is
+    waiting, so join/leave never do work proportional to the queue size.
+    """
+
+    def __init__(
+        self,
+        on_match: Callable[[QueueEntry, QueueEntry], Awaitable[None]],
+        interval: float = MATCHMAKING_INTERVAL,
+        use_rating: bool = MATCHMAKING_USE_RATING,
+    ):
+        self.on_match = on_match
+        self.interval = interval
+        self.use_rating = use_rating
+        self.queue: Deque[QueueEntry] = deque()
+        self.by_player: Dict[str, QueueEntry] = {}
+        self.by_socket: Dict[WebSocket, QueueEntry] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.by_player)
+
+    async def add_player(self, websocket: WebSocket, player_id: str):
+        await websocket.accept()
+
+        rating = None
+        if self.use_rating:
+            loop = asyncio.get_running_loop()
+            stats = await loop.run_in_executor(None, get_player_stats, player_id)
+            rating = win_rate(stats)
+
+        existing = self.by_player.get(player_id)
+        if existing is not None:
+            # Re-join (e.g. a page reload): keep the queue position, move to the new socket.
+            old_websocket = existing.websocket
+            del self.by_socket[old_websocket]
+            existing.websocket = websocket
+            if rating is not None:
+                existing.rating = rating
+            self.by_socket[websocket] = existing
+            try:
+                await old_websocket.close()
+            except Exception as e:
+                print(f"Error closing stale matchmaking socket for {player_id}: {e}")
+            print(f"Player {player_id} rejoined matchmaking queue. Queue size: {len(self)}")
+        else:
+            entry = QueueEntry(player_id, websocket, rating)
+            self.queue.append(entry)
+            self.by_player[player_id] = entry
+            self.by_socket[websocket] = entry
+            print(f"Player {player_id} added to matchmaking queue. Queue size: {len(self)}")
+
+        self._ensure_matcher()
+
+    def remove_player(self, websocket: WebSocket):
+        entry = self.by_socket.pop(websocket, None)
+        if entry is None:
+            return
+        entry.active = False
+        del self.by_player[entry.player_id]
+        if not self.by_player:
+            # Nothing left to match; drop the flagged entries now.
+            self.queue.clear()
+        print(f"Player removed from matchmaking queue. Queue size: {len(self)}")
+
+    def _ensure_matcher(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # Stops by itself once the queue drains; add_player restarts it.
+        while self.by_player:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.match_waiting()
+            except Exception as e:
+                print(f"Error during matchmaking pass: {e}")
+
+    async def match_waiting(self):
+        """Run one batch matching pass over everyone currently waiting."""
+        waiting = [e for e in self.queue if e.active]
+        if self.use_rating:
+            pairs = self._pair_by_rating(waiting, time.monotonic())
+        else:
+            pairs = [(waiting[i], waiting[i + 1]) for i in range(0, len(waiting) - 1, 2)]
+
+        for player1, player2 in pairs:
+            for entry in (player1, player2):
+                entry.active = False
+                del self.by_player[entry.player_id]
+                del self.by_socket[entry.websocket]
+
+        # Rebuilding here also drops entries flagged by remove_player.
+        self.queue = deque(e for e in waiting if e.active)
+
+        if pairs:
+            await asyncio.gather(*(self.on_match(p1, p2) for p1, p2 in pairs))
+
+    def _pair_by_rating(self, waiting: List[QueueEntry], now: float) -> List[Tuple[QueueEntry, QueueEntry]]:
+        pairs = []
+        ranked = sorted(waiting, key=lambda e: DEFAULT_RATING if e.rating is None else e.rating)
+        i = 0
+        while i < len(ranked) - 1:
+            a, b = ranked[i], ranked[i + 1]
+            rating_a = DEFAULT_RATING if a.rating is None else a.rating
+            rating_b = DEFAULT_RATING if b.rating is None else b.rating
+            if abs(rating_a - rating_b) <= max(a.window(now), b.window(now)):
+                # Whoever waited longer plays Tiger, as in plain FIFO order.
+                pairs.append((a, b) if a.joined_at <= b.joined_at else (b, a))
+                i += 2
+            else:
+                i += 1
+        return pairs
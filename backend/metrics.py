@@ -0,0 +1,259 @@
+"""
+Lightweight Prometheus-style metrics.
+
+Counters, gauges and histograms are kept in process memory and rendered in
+the Prometheus text exposition format by GET /metrics. Hot paths only pay for
+instrumentation when METRICS_ENABLED=1; otherwise timers are a shared no-op
+context manager and observations are skipped.
+
+AI_PROFILE_SAMPLE_RATE (0..1) turns on the sampling profiler: that fraction
+of AIEngine.get_best_move calls runs under cProfile, and the stats are dumped
+to AI_PROFILE_DIR.
+"""
+import bisect
+import cProfile
+import os
+import random
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0") == "1"
+AI_PROFILE_SAMPLE_RATE = float(os.environ.get("AI_PROFILE_SAMPLE_RATE", "0"))
+AI_PROFILE_DIR = os.environ.get("AI_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ai_profiles"))
+
+# Seconds; covers sub-millisecond validation up to multi-second AI searches.
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        # Guards children and values: updates also come from threadpool searches
+        self._lock = threading.Lock()
+
+    def labels(self, *labelvalues: str):
+        key = tuple(str(v) for v in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self) -> "_Metric":
+        return type(self)(self.name, self.help)
+
+    @abstractmethod
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        ...
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.labelnames:
+            for labelvalues, child in sorted(self._children.items()):
+                for suffix, extra, value in child._samples():
+                    labels = _format_labels(self.labelnames, labelvalues, extra)
+                    lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        else:
+            for suffix, extra, value in self._samples():
+                labels = _format_labels((), (), extra)
+                lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def _samples(self):
+        return [("", "", self.value)]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.value = 0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the value at scrape time instead of tracking it on every change."""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                return [("", "", self._function())]
+            except Exception as e:
+                print(f"Error computing gauge {self.name}: {e}")
+        return [("", "", self.value)]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def _samples(self):
+        with self._lock:
+            counts, total, observations = list(self.counts), self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            samples.append(("_bucket", f'le="{_format_value(bound)}"', cumulative))
+        samples.append(("_sum", "", total))
+        samples.append(("_count", "", observations))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# Game Server
+MOVE_VALIDATION_SECONDS = registry.register(Histogram(
+    "move_validation_seconds", "Time spent validating and applying a submitted move"))
+BROADCAST_SECONDS = registry.register(Histogram(
+    "broadcast_seconds", "Time to fan a state update out to every socket of a match"))
+BROADCAST_RECIPIENTS = registry.register(Counter(
+    "broadcast_recipients_total", "Messages sent by match broadcasts"))
+ACTIVE_GAMES = registry.register(Gauge(
+    "active_games", "Games in memory that are not over"))
+ACTIVE_SOCKETS = registry.register(Gauge(
+    "active_sockets", "Open match websockets (players and spectators)"))
+MATCHMAKING_QUEUE_DEPTH = registry.register(Gauge(
+    "matchmaking_queue_depth", "Players waiting for a match"))
+
+# AI
+AI_SEARCH_SECONDS = registry.register(Histogram(
+    "ai_search_seconds", "Wall time of AIEngine.get_best_move"))
+AI_NODES_SEARCHED = registry.register(Counter(
+    "ai_nodes_searched_total", "Positions visited by the AI search"))
+AI_NODES_PER_SECOND = registry.register(Gauge(
+    "ai_nodes_per_second", "Search speed of the most recent AI move"))
+AI_QUEUE_DEPTH = registry.register(Gauge(
+    "ai_queue_depth", "AI move requests waiting for a CPU slot"))
+AI_QUEUE_DELAY_SECONDS = registry.register(Histogram(
+    "ai_queue_delay_seconds", "Time an AI move request waited before its search started"))
+AI_DEGRADED_SEARCHES = registry.register(Counter(
+    "ai_degraded_searches_total", "AI searches run at reduced depth because of load"))
+AI_REJECTED_REQUESTS = registry.register(Counter(
+    "ai_rejected_requests_total", "AI move requests over the queue caps, answered with an in-process depth-1 move"))
+
+# Storage
+FIRESTORE_CALL_SECONDS = registry.register(Histogram(
+    "firestore_call_seconds", "Latency of Firestore calls", labelnames=("op",)))
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+def timer(histogram: Histogram):
+    """Time a block into `histogram`. A shared no-op when metrics are disabled."""
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(histogram)
+
+def record_ai_search(seconds: float, nodes: int):
+    if not METRICS_ENABLED:
+        return
+    AI_SEARCH_SECONDS.observe(seconds)
+    AI_NODES_SEARCHED.inc(nodes)
+    if seconds > 0:
+        AI_NODES_PER_SECOND.set(nodes / seconds)
+
+@contextmanager
+def maybe_profile(label: str):
+    """Run the block under cProfile for a sampled fraction of calls."""
+    if AI_PROFILE_SAMPLE_RATE <= 0 or random.random() >= AI_PROFILE_SAMPLE_RATE:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            os.makedirs(AI_PROFILE_DIR, exist_ok=True)
+            path = os.path.join(AI_PROFILE_DIR, f"{label}-{int(time.time() * 1000)}.prof")
+            profiler.dump_stats(path)
+            print(f"Saved {label} profile to {path}")
+        except OSError as e:
+            print(f"Error saving {label} profile: {e}")
@@ -23,3 +23,10 @@ class Move(BaseModel):
     to_node: int
     playerId: str
 
+
+class Position(BaseModel):
+    """A bare board position, e.g. for analysis. Phase is derived from goatsInHand."""
+    board: List[Literal["T", "G", "E"]]
+    activePlayer: Literal["TIGER", "GOAT"]
+    goatsInHand: int
+    goatsKilled: int = 0
@@ -0,0 +1,388 @@
+"""
+Proof-number search for forced wins.
+
+Depth-first proof-number search (df-pn) decides whether one side, the
+attacker, can force a win from a position: a tiger capture limit
+(CAPTURE_LIMIT) or trapped tigers (STALEMATE). Unlike minimax it has no
+depth horizon. It grows the tree where proving or disproving is cheapest,
+so short forced sequences are found quickly even when the full tree is
+huge.
+
+The search runs on a compact copy of the GameEngine rules (tuples of ints,
+integer Zobrist keys), and results are kept in a size-bounded
+transposition table. Anything that is not a win for the attacker counts as
+a failure: a draw, a side with no legal moves, a position repeated along
+the line (or found in the game history), and lines longer than max_depth.
+This keeps every reported win sound. NO_WIN therefore means "no forced win
+without repetition", not that the defender wins.
+
+Run from the repository root to solve opening lines:
+    python -m backend.pn_search --line 5,0-3,12 --expand
+    python -m backend.pn_search --random 20 --goats-in-hand 3
+"""
+import argparse
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from backend.game_engine import ADJACENCY_MAP, JUMP_TABLE, ZOBRIST_KEYS, GameEngine
+from backend.models import GameState, Move
+
+WIN = "WIN"
+NO_WIN = "NO_WIN"
+UNKNOWN = "UNKNOWN"
+
+INF = 10 ** 9
+
+EMPTY, TIGER, GOAT = 0, 1, 2
+PIECE_CODES = {"E": EMPTY, "T": TIGER, "G": GOAT}
+SIDES = ("TIGER", "GOAT")
+SIDE_CODES = {"TIGER": 0, "GOAT": 1}
+
+NEIGHBOURS: Tuple[Tuple[int, ...], ...] = tuple(tuple(ADJACENCY_MAP[i]) for i in range(23))
+# node -> ((over, land), ...)
+JUMPS: Tuple[Tuple[Tuple[int, int], ...], ...] = tuple(
+    tuple(sorted((over, land) for start, over, land in JUMP_TABLE if start == i)) for i in range(23)
+)
+
+PIECE_KEYS = [[0, 0, 0] for _ in range(23)]
+for _node in range(23):
+    PIECE_KEYS[_node][TIGER] = ZOBRIST_KEYS["PIECES"][(_node, "T")]
+    PIECE_KEYS[_node][GOAT] = ZOBRIST_KEYS["PIECES"][(_node, "G")]
+TURN_KEYS = (ZOBRIST_KEYS["TURN"]["TIGER"], ZOBRIST_KEYS["TURN"]["GOAT"])
+HAND_KEYS = tuple(ZOBRIST_KEYS["GOATS_HAND"][i] for i in range(16))
+KILLED_KEYS = tuple(ZOBRIST_KEYS["GOATS_KILLED"][i] for i in range(6))
+
+# (board, side to move (0 tiger / 1 goat), goats in hand, goats killed, zobrist key)
+Position = Tuple[Tuple[int, ...], int, int, int, int]
+# (from_node or None, to_node)
+CompactMove = Tuple[Optional[int], int]
+
+def position_from_state(state: GameState) -> Position:
+    board = tuple(PIECE_CODES[p] for p in state.board)
+    return (board, SIDE_CODES[state.activePlayer], state.goatsInHand, state.goatsKilled, int(state.zobristHash, 16))
+
+def tigers_can_move(board: Sequence[int]) -> bool:
+    for node in range(23):
+        if board[node] != TIGER:
+            continue
+        for neighbour in NEIGHBOURS[node]:
+            if board[neighbour] == EMPTY:
+                return True
+        for over, land in JUMPS[node]:
+            if board[over] == GOAT and board[land] == EMPTY:
+                return True
+    return False
+
+def winner_after_move(board: Sequence[int], goats_killed: int) -> Optional[int]:
+    """Mirror of GameEngine._check_win_condition, run after every move."""
+    if goats_killed >= 5:
+        return 0
+    if not tigers_can_move(board):
+        return 1
+    return None
+
+def generate_moves(position: Position) -> List[CompactMove]:
+    """Mirror of GameEngine.get_valid_moves for the side to move."""
+    board, side, goats_in_hand, _, _ = position
+    moves: List[CompactMove] = []
+    if side == 1 and goats_in_hand > 0:
+        return [(None, node) for node in range(23) if board[node] == EMPTY]
+
+    piece = TIGER if side == 0 else GOAT
+    for node in range(23):
+        if board[node] != piece:
+            continue
+        for neighbour in NEIGHBOURS[node]:
+            if board[neighbour] == EMPTY:
+                moves.append((node, neighbour))
+        if piece == TIGER:
+            for over, land in JUMPS[node]:
+                if board[over] == GOAT and board[land] == EMPTY:
+                    moves.append((node, land))
+    return moves
+
+def play(position: Position, move: CompactMove) -> Tuple[Position, Optional[int]]:
+    """Apply a legal move; returns the new position and the winner (0/1) if the game ended."""
+    board, side, goats_in_hand, goats_killed, key = position
+    start, land = move
+    cells = list(board)
+    key ^= TURN_KEYS[side] ^ TURN_KEYS[1 - side]
+
+    if start is None:
+        cells[land] = GOAT
+        key ^= PIECE_KEYS[land][GOAT] ^ HAND_KEYS[goats_in_hand] ^ HAND_KEYS[goats_in_hand - 1]
+        goats_in_hand -= 1
+    else:
+        piece = cells[start]
+        cells[start] = EMPTY
+        cells[land] = piece
+        key ^= PIECE_KEYS[start][piece] ^ PIECE_KEYS[land][piece]
+        if land not in NEIGHBOURS[start]:
+            for over, jump_land in JUMPS[start]:
+                if jump_land == land:
+                    cells[over] = EMPTY
+                    key ^= PIECE_KEYS[over][GOAT] ^ KILLED_KEYS[goats_killed] ^ KILLED_KEYS[goats_killed + 1]
+                    goats_killed += 1
+                    break
+
+    winner = winner_after_move(cells, goats_killed)
+    return (tuple(cells), 1 - side, goats_in_hand, goats_killed, key), winner
+
+class PNResult:
+    __slots__ = ("status", "move", "nodes", "seconds")
+
+    def __init__(self, status: str, move: Optional[Move], nodes: int, seconds: float):
+        self.status = status
+        self.move = move
+        self.nodes = nodes
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"PNResult({self.status}, move={self.move}, nodes={self.nodes}, seconds={self.seconds:.3f})"
+
+class ProofNumberSearch:
+    """
+    df-pn with a bounded transposition table. Proof and disproof numbers are
+    kept in phi/delta form: phi is the proof number for the side to move
+    reaching its goal, delta the disproof number.
+    """
+
+    def __init__(self, max_nodes: int = 100000, max_entries: int = 200000, max_depth: int = 120):
+        self.max_nodes = max_nodes
+        self.max_entries = max_entries
+        self.max_depth = max_depth
+        # zobrist key -> [phi, delta, work]
+        self.tt: Dict[int, List[int]] = {}
+        self.nodes = 0
+        self.attacker = 0
+        # perf_counter() time at which solve() gives up, if any
+        self.deadline: Optional[float] = None
+        self._path: set = set()
+
+    def solve(self, state: GameState, attacker: Optional[str] = None, deadline: Optional[float] = None) -> PNResult:
+        """
+        Try to prove a forced win for `attacker` (default: the side to move)
+        within max_nodes expansions and, if given, before the perf_counter()
+        time `deadline`. When the attacker is to move and wins, the result
+        carries the first move of the proof.
+        """
+        start = time.perf_counter()
+        self.attacker = SIDE_CODES[attacker or state.activePlayer]
+        self.nodes = 0
+        self.tt = {}
+        self.deadline = deadline
+
+        if state.phase == "GAME_OVER":
+            status = WIN if state.winner == SIDES[self.attacker] else NO_WIN
+            return PNResult(status, None, 0, time.perf_counter() - start)
+
+        root = position_from_state(state)
+        # Earlier positions of the game count as repetitions.
+        self._path = {int(h, 16) for h in state.history}
+        self._path.add(root[4])
+
+        while not self._exhausted():
+            phi, delta = self._mid(root, INF, INF, 0)
+            if phi == 0 or delta == 0:
+                break
+
+        phi, delta = self._lookup(root[4])
+        to_move_is_attacker = root[1] == self.attacker
+        status = UNKNOWN
+        if phi == 0:
+            status = WIN if to_move_is_attacker else NO_WIN
+        elif delta == 0:
+            status = NO_WIN if to_move_is_attacker else WIN
+
+        move = None
+        if status == WIN and to_move_is_attacker:
+            move = self._proving_move(root)
+        return PNResult(status, move, self.nodes, time.perf_counter() - start)
+
+    def _exhausted(self) -> bool:
+        return self.nodes >= self.max_nodes or (self.deadline is not None and time.perf_counter() > self.deadline)
+
+    def _lookup(self, key: int) -> Tuple[int, int]:
+        entry = self.tt.get(key)
+        if entry is None:
+            return 1, 1
+        return entry[0], entry[1]
+
+    def _store(self, key: int, phi: int, delta: int, work: int):
+        entry = self.tt.get(key)
+        if entry is None:
+            if len(self.tt) >= self.max_entries:
+                self._prune()
+            self.tt[key] = [phi, delta, work]
+        else:
+            entry[0], entry[1], entry[2] = phi, delta, entry[2] + work
+
+    def _prune(self):
+        """Drop the cheaper half of the unresolved entries; solved ones are kept while possible."""
+        unresolved = [(entry[2], key) for key, entry in self.tt.items() if entry[0] and entry[1]]
+        unresolved.sort()
+        victims = unresolved[:max(1, len(self.tt) // 2)]
+        for _, key in victims:
+            del self.tt[key]
+        if len(self.tt) >= self.max_entries:
+            self.tt.clear()
+
+    def _terminal(self, side: int, winner: Optional[int]) -> Tuple[int, int]:
+        """phi/delta for a finished line, from the point of view of `side` (to move)."""
+        # The side to move reaches its goal if it is the attacker and the attacker won,
+        # or it is the defender and the attacker did not win.
+        attacker_won = winner == self.attacker
+        if (side == self.attacker) == attacker_won:
+            return 0, INF
+        return INF, 0
+
+    def _children(self, position: Position, depth: int):
+        children = []
+        for move in generate_moves(position):
+            child, winner = play(position, move)
+            if winner is not None:
+                value = self._terminal(child[1], winner)
+            elif child[4] in self._path or depth + 1 >= self.max_depth:
+                # Repetition or horizon: not a win for the attacker
+                value = self._terminal(child[1], None)
+            else:
+                value = None
+            children.append((move, child, value))
+        return children
+
+    def _child_value(self, child: Position, value: Optional[Tuple[int, int]]) -> Tuple[int, int]:
+        return value if value is not None else self._lookup(child[4])
+
+    def _mid(self, position: Position, th_phi: int, th_delta: int, depth: int) -> Tuple[int, int]:
+        key = position[4]
+        self.nodes += 1
+        children = self._children(position, depth)
+        if not children:
+            # The side to move is stuck: the game cannot continue, so nobody wins.
+            phi, delta = self._terminal(position[1], None)
+            self._store(key, phi, delta, 1)
+            return phi, delta
+
+        self._path.add(key)
+        nodes_before = self.nodes
+        try:
+            while True:
+                phi, delta, best, second_delta = self._select(children)
+                if phi >= th_phi or delta >= th_delta or self._exhausted():
+                    break
+
+                _, child, _ = children[best]
+                child_phi, child_delta = self._lookup(child[4])
+                child_th_phi = min(INF, th_delta - delta + child_phi)
+                child_th_delta = min(th_phi, int(second_delta * 1.25) + 1)
+                self._mid(child, child_th_phi, child_th_delta, depth + 1)
+        finally:
+            self._path.discard(key)
+
+        self._store(key, phi, delta, self.nodes - nodes_before + 1)
+        return phi, delta
+
+    def _select(self, children) -> Tuple[int, int, int, int]:
+        """phi/delta of the node from its children, the most proving child and the runner-up's delta."""
+        phi = INF
+        delta = 0
+        best = 0
+        best_delta = INF
+        second_delta = INF
+        for index, (_, child, value) in enumerate(children):
+            child_phi, child_delta = self._child_value(child, value)
+            # A child is good for us when its side to move (the opponent) fails: small child delta.
+            phi = min(phi, child_delta)
+            delta = min(INF, delta + child_phi)
+            if value is None and child_delta < best_delta:
+                second_delta = best_delta
+                best_delta = child_delta
+                best = index
+            elif value is None and child_delta < second_delta:
+                second_delta = child_delta
+        return phi, delta, best, second_delta
+
+    def _proving_move(self, root: Position) -> Optional[Move]:
+        self._path.add(root[4])
+        side = SIDES[root[1]]
+        for move, child, value in self._children(root, 0):
+            _, child_delta = self._child_value(child, value)
+            if child_delta == 0:
+                return Move(player=side, from_node=move[0], to_node=move[1], playerId="AI")
+        return None
+
+def parse_line(line: str) -> List[CompactMove]:
+    """'5,0-3,12' -> [(None, 5), (0, 3), (None, 12)]: placements are a node, moves from-to."""
+    moves: List[CompactMove] = []
+    for token in filter(None, (t.strip() for t in line.split(","))):
+        if "-" in token:
+            start, land = token.split("-")
+            moves.append((int(start), int(land)))
+        else:
+            moves.append((None, int(token)))
+    return moves
+
+def play_line(line: Sequence[CompactMove]) -> GameEngine:
+    engine = GameEngine()
+    for start, land in line:
+        engine.apply_move(Move(player=engine.state.activePlayer, from_node=start, to_node=land, playerId="AI"))
+    return engine
+
+def random_position(rng: random.Random, goats_in_hand: int) -> GameEngine:
+    """Play random moves until `goats_in_hand` goats are left to place (0: into the movement phase)."""
+    while True:
+        engine = GameEngine()
+        target_plies = rng.randint(0, 10) if goats_in_hand == 0 else 0
+        while engine.state.phase != "GAME_OVER":
+            if engine.state.goatsInHand <= goats_in_hand and engine.state.activePlayer == "GOAT":
+                if target_plies == 0:
+                    return engine
+                target_plies -= 1
+            moves = engine.get_valid_moves(engine.state.activePlayer)
+            if not moves:
+                break
+            engine.apply_move(rng.choice(moves))
+
+def format_move(move: Optional[Move]) -> str:
+    if move is None:
+        return "-"
+    return str(move.to_node) if move.from_node is None else f"{move.from_node}-{move.to_node}"
+
+def report(label: str, state: GameState, result: PNResult, attacker: str):
+    print(f"{label:<24} {state.activePlayer:<5} to move  {attacker:<5} {result.status:<7} "
+          f"move={format_move(result.move):<6} nodes={result.nodes:<8} {result.seconds * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prove or disprove forced wins with df-pn")
+    parser.add_argument("--line", default="", help="Moves from the start position, e.g. '5,0-3,12'")
+    parser.add_argument("--attacker", choices=SIDES, help="Side trying to force a win (default: side to move)")
+    parser.add_argument("--expand", action="store_true", help="Also solve every reply, for the side that plays it")
+    parser.add_argument("--random", type=int, default=0, help="Solve this many random positions instead of --line")
+    parser.add_argument("--goats-in-hand", type=int, default=2, help="Goats left to place in --random positions")
+    parser.add_argument("--nodes", type=int, default=100000, help="Node budget per search")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    solver = ProofNumberSearch(max_nodes=args.nodes)
+
+    if args.random:
+        rng = random.Random(args.seed)
+        counts: Dict[str, int] = {WIN: 0, NO_WIN: 0, UNKNOWN: 0}
+        start = time.perf_counter()
+        for i in range(args.random):
+            state = random_position(rng, args.goats_in_hand).state
+            for attacker in SIDES:
+                result = solver.solve(state, attacker)
+                counts[result.status] += 1
+                report(f"random #{i}", state, result, attacker)
+        print(f"\n{counts}  total {time.perf_counter() - start:.2f}s")
+    else:
+        state = play_line(parse_line(args.line)).state
+        attacker = args.attacker or state.activePlayer
+        report(args.line or "start", state, solver.solve(state, attacker), attacker)
+        if args.expand and state.phase != "GAME_OVER":
+            for start, land in generate_moves(position_from_state(state)):
+                engine = GameEngine(state=state.model_copy(deep=True))
+                engine.apply_move(Move(player=state.activePlayer, from_node=start, to_node=land, playerId="AI"))
+                label = f"  {land}" if start is None else f"  {start}-{land}"
+                report(label, engine.state, solver.solve(engine.state, state.activePlayer), state.activePlayer)
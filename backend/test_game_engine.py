@@ -0,0 +1,59 @@
+import random
+from collections import Counter
+from backend.game_engine import GameEngine, compute_zobrist_hash
+
+def snapshot(engine: GameEngine):
+    state = engine.state
+    return (
+        state.model_dump(),
+        dict(engine._position_counts()),
+        len(engine.moves),
+    )
+
+def test_undo_restores_every_position():
+    rng = random.Random(7)
+    for _ in range(50):
+        engine = GameEngine()
+        snapshots = [snapshot(engine)]
+        versions = [engine.version]
+        while engine.state.phase != "GAME_OVER":
+            engine.apply_move(rng.choice(engine.get_valid_moves(engine.state.activePlayer)))
+            state = engine.state
+            # The incremental hash and repetition counts match a from-scratch computation
+            assert state.zobristHash == compute_zobrist_hash(state.board, state.activePlayer, state.goatsInHand, state.goatsKilled)
+            assert engine._position_counts() == Counter(state.history)
+            snapshots.append(snapshot(engine))
+            versions.append(engine.version)
+
+        while engine.moves:
+            version = engine.version
+            engine.undo_move()
+            snapshots.pop()
+            assert snapshot(engine) == snapshots[-1]
+            # Undo is a change too, so cached snapshots and ETags never go back
+            assert engine.version == version + 1
+
+def test_rejected_move_leaves_state_untouched():
+    rng = random.Random(11)
+    engine = GameEngine()
+    for _ in range(20):
+        engine.apply_move(rng.choice(engine.get_valid_moves(engine.state.activePlayer)))
+
+    before, version = snapshot(engine), engine.version
+    legal = {(m.from_node, m.to_node) for m in engine.get_valid_moves(engine.state.activePlayer)}
+    for move in GameEngine().get_valid_moves("GOAT") + engine.get_valid_moves("TIGER" if engine.state.activePlayer == "GOAT" else "GOAT"):
+        move = move.model_copy(update={"player": engine.state.activePlayer})
+        if (move.from_node, move.to_node) in legal:
+            continue
+        try:
+            engine.apply_move(move)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"illegal move accepted: {move}")
+        assert snapshot(engine) == before and engine.version == version
+
+if __name__ == "__main__":
+    test_undo_restores_every_position()
+    test_rejected_move_leaves_state_untouched()
+    print("GameEngine undo/rollback checks passed")
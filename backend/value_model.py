@@ -0,0 +1,409 @@
+"""
+Learned position evaluation.
+
+A small value model maps batch_engine.features, plus which node each
+piece stands on, to a value in -1..1 from the tiger's point of view. The
+model is linear by default, or a one-hidden-layer MLP, with a tanh output.
+It is trained on game outcomes. Inference is plain NumPy over a whole
+PositionBatch, so the AI scores all leaves below a node with one call
+instead of one Python evaluation per leaf.
+
+Weights live in versioned JSON files under backend/weights/. value_v1.json
+ships with the repo. Each file records the feature names it was trained
+on, and loading refuses a file whose features no longer match.
+
+Training data comes from vectorized self-play or from recorded games.
+In self-play, both sides run a depth-2 search on the hand-written
+evaluation, with 5% random moves.
+
+Run from the repository root:
+    python -m backend.value_model train [--games N] [--records games.apgr] [--out path]
+    python -m backend.value_model bench
+    python -m backend.value_model compare [--games N]
+"""
+import argparse
+import json
+import os
+import random
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from backend.batch_engine import (
+    FEATURE_NAMES, GAME_OVER, GOAT, NUM_NODES, SIDE_CODES, TIGER, PositionBatch, apply_moves, evaluate, features,
+    legal_move_mask, node_mask,
+)
+from backend.game_engine import GameEngine
+from backend.game_record import read_game_records
+from backend.models import GameState
+
+MODEL_FORMAT = 1
+WEIGHTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights")
+DEFAULT_WEIGHTS = os.path.join(WEIGHTS_DIR, "value_v1.json")
+
+# Learned values (-1..1) are scaled into the range of the hand-written
+# evaluation; decided games still score +-10000.
+VALUE_SCALE = 1000.0
+WIN_SCORE = 10000.0
+
+# batch_engine.features plus which node each piece stands on
+VALUE_FEATURE_NAMES = FEATURE_NAMES + [f"tiger_at_{i}" for i in range(NUM_NODES)] + [f"goat_at_{i}" for i in range(NUM_NODES)]
+
+def value_features(batch: PositionBatch) -> np.ndarray:
+    """N x len(VALUE_FEATURE_NAMES) float32 model inputs."""
+    return np.hstack([features(batch), node_mask(batch.tigers), node_mask(batch.goats)]).astype(np.float32)
+
+class ValueModel:
+    def __init__(self, mean: np.ndarray, std: np.ndarray, layers: List[Tuple[np.ndarray, np.ndarray]],
+                 version: str = "unversioned", metadata: Optional[Dict] = None):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.layers = [(np.asarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32)) for w, b in layers]
+        self.version = version
+        self.metadata = metadata or {}
+
+    @classmethod
+    def load(cls, path: str) -> "ValueModel":
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("format") != MODEL_FORMAT:
+            raise ValueError(f"Unsupported value model format {data.get('format')} in {path}")
+        if data.get("features") != VALUE_FEATURE_NAMES:
+            raise ValueError(f"{path} was trained on different features than this version computes")
+        layers = [(layer["weights"], layer["bias"]) for layer in data["layers"]]
+        return cls(data["mean"], data["std"], layers, data.get("version", "unversioned"), data.get("training"))
+
+    def save(self, path: str):
+        data = {
+            "format": MODEL_FORMAT,
+            "version": self.version,
+            "features": VALUE_FEATURE_NAMES,
+            "mean": self.mean.tolist(),
+            "std": self.std.tolist(),
+            "layers": [{"weights": w.tolist(), "bias": b.tolist()} for w, b in self.layers],
+            "training": self.metadata,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1)
+            f.write("\n")
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        """Values (-1..1, tiger's view) for an N x len(VALUE_FEATURE_NAMES) feature matrix."""
+        h = (x - self.mean) / self.std
+        for w, b in self.layers:
+            h = np.tanh(h @ w + b)
+        return h[:, 0]
+
+    def evaluate(self, batch: PositionBatch, ai_player: int) -> np.ndarray:
+        """Drop-in for batch_engine.evaluate: scores from ai_player's view."""
+        sign = 1.0 if ai_player == TIGER else -1.0
+        score = sign * VALUE_SCALE * self.predict(value_features(batch))
+        decided = batch.winner != 0
+        return np.where(decided, np.where(batch.winner == ai_player, WIN_SCORE, -WIN_SCORE), score)
+
+    def evaluate_states(self, states: Sequence[GameState], ai_player: str) -> List[float]:
+        if not states:
+            return []
+        return self.evaluate(PositionBatch.from_states(states), SIDE_CODES[ai_player]).tolist()
+
+@lru_cache(maxsize=4)
+def load_value_model(path: str = DEFAULT_WEIGHTS) -> ValueModel:
+    """Load the weights once per process; AIEngine instances share them."""
+    return ValueModel.load(path)
+
+# Training
+
+def _group_reduce(values: np.ndarray, groups: np.ndarray, size: int, reduce) -> np.ndarray:
+    """Per-group max or min (`reduce` is np.maximum / np.minimum) of values labelled 0..size-1."""
+    out = np.full(size, -np.inf if reduce is np.maximum else np.inf)
+    reduce.at(out, groups, values)
+    return out
+
+def _search_scores(batch: PositionBatch, depth: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Score every legal move of every position with a depth-1 or depth-2
+    minimax on the hand-written evaluation, from the mover's view.
+    Returns (rows, codes, scores).
+    """
+    rows, codes = np.nonzero(legal_move_mask(batch))
+    children = apply_moves(batch.take(rows), codes)
+    mover = batch.side[rows]
+    scores = evaluate(children, TIGER).astype(np.float64)
+
+    if depth > 1:
+        replies_rows, replies_codes = np.nonzero(legal_move_mask(children) & (children.phase != GAME_OVER)[:, None])
+        if len(replies_rows):
+            grandchildren = apply_moves(children.take(replies_rows), replies_codes)
+            reply_scores = evaluate(grandchildren, TIGER).astype(np.float64)
+            # The opponent picks the reply that is worst for the mover.
+            best_for_tiger = _group_reduce(reply_scores, replies_rows, len(children), np.maximum)
+            best_for_goat = _group_reduce(reply_scores, replies_rows, len(children), np.minimum)
+            replied = np.isfinite(best_for_tiger)
+            scores = np.where(replied, np.where(mover == TIGER, best_for_goat, best_for_tiger), scores)
+
+    return rows, codes, np.where(mover == TIGER, scores, -scores)
+
+def _pick_moves(batch: PositionBatch, rng: np.random.Generator, epsilon: float, depth: int) -> np.ndarray:
+    """One move code per position: the search's choice, or a random move with probability epsilon."""
+    rows, codes, scores = _search_scores(batch, depth)
+
+    def first_per_row(keys: np.ndarray) -> np.ndarray:
+        order = np.lexsort((keys, rows))
+        sorted_rows = rows[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_rows[1:] != sorted_rows[:-1]
+        return codes[order][first]
+
+    # Random tie-breaking keeps self-play games from all being identical.
+    greedy = first_per_row(-scores - rng.random(len(rows)))
+    explore = first_per_row(rng.random(len(rows)))
+    return np.where(rng.random(len(batch)) < epsilon, explore, greedy)
+
+def self_play(games: int, seed: int = 0, epsilon: float = 0.05, depth: int = 2,
+              max_plies: int = 300, chunk: int = 1000) -> Tuple[PositionBatch, np.ndarray]:
+    """
+    Play `games` games side by side (`chunk` at a time, to bound memory),
+    both sides searching `depth` plies on the hand-written evaluation, and
+    return every position reached with its game's outcome: +1 tiger win,
+    -1 goat win, 0 unfinished.
+    """
+    rng = np.random.default_rng(seed)
+    positions, outcomes = [], []
+    for first in range(0, games, chunk):
+        batch, outcome = _self_play_chunk(min(chunk, games - first), rng, epsilon, depth, max_plies)
+        positions.append(batch)
+        outcomes.append(outcome)
+    return _concat(positions), np.concatenate(outcomes)
+
+def _self_play_chunk(games: int, rng: np.random.Generator, epsilon: float, depth: int,
+                     max_plies: int) -> Tuple[PositionBatch, np.ndarray]:
+    batch = PositionBatch.from_states([GameEngine().state] * games)
+    ids = np.arange(games)
+    outcome = np.zeros(games, dtype=np.float32)
+    positions, game_ids = [], []
+
+    for _ in range(max_plies):
+        mask = legal_move_mask(batch)
+        movable = mask.any(axis=1)
+        batch, ids = batch.take(movable), ids[movable]
+        if not len(batch):
+            break
+        positions.append(batch)
+        game_ids.append(ids)
+
+        batch = apply_moves(batch, _pick_moves(batch, rng, epsilon, depth))
+        done = batch.phase == GAME_OVER
+        outcome[ids[done]] = np.where(batch.winner[done] == TIGER, 1.0, -1.0)
+        batch, ids = batch.take(~done), ids[~done]
+
+    return _concat(positions), outcome[np.concatenate(game_ids)]
+
+def record_positions(path: str) -> Tuple[PositionBatch, np.ndarray]:
+    """Every position of the recorded games that finished on the board, with the game's outcome."""
+    games, ys = [], []
+    for record in read_game_records(path):
+        if record.winner is None or record.win_reason in ("FORFEIT", "OPPONENT_DISCONNECTED"):
+            continue
+        batch = PositionBatch.from_states([GameEngine().state])
+        positions = []
+        for code in record.moves:
+            positions.append(batch)
+            batch = apply_moves(batch, np.array([code], dtype=np.intp))
+        games.append(_concat(positions))
+        ys.append(np.full(len(positions), 1.0 if record.winner == "TIGER" else -1.0, dtype=np.float32))
+    if not games:
+        raise ValueError(f"No finished games in {path}")
+    return _concat(games), np.concatenate(ys)
+
+def _concat(batches: List[PositionBatch]) -> PositionBatch:
+    return PositionBatch.concatenate(batches)
+
+def train(x: np.ndarray, y: np.ndarray, hidden: int = 0, epochs: int = 10, batch_size: int = 1024,
+          learning_rate: float = 0.003, seed: int = 0) -> Tuple[ValueModel, Dict]:
+    """Fit a one-hidden-layer tanh MLP (hidden=0: linear) to the outcomes with Adam on squared error."""
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(x))
+    x, y = x[order].astype(np.float32), y[order].astype(np.float32)
+    split = int(len(x) * 0.9)
+    x_train, y_train, x_val, y_val = x[:split], y[:split], x[split:], y[split:]
+
+    mean = x_train.mean(axis=0)
+    std = x_train.std(axis=0) + 1e-6
+    sizes = [x.shape[1]] + ([hidden] if hidden else []) + [1]
+    params = []
+    for fan_in, fan_out in zip(sizes[:-1], sizes[1:]):
+        params.append(rng.normal(0, 1 / np.sqrt(fan_in), (fan_in, fan_out)).astype(np.float32))
+        params.append(np.zeros(fan_out, dtype=np.float32))
+    moments = [np.zeros_like(p) for p in params]
+    velocities = [np.zeros_like(p) for p in params]
+    step = 0
+
+    for _ in range(epochs):
+        for start in range(0, len(x_train), batch_size):
+            xb = (x_train[start:start + batch_size] - mean) / std
+            yb = y_train[start:start + batch_size]
+
+            activations = [xb]
+            for i in range(0, len(params), 2):
+                activations.append(np.tanh(activations[-1] @ params[i] + params[i + 1]))
+            grad = 2 * (activations[-1][:, 0] - yb)[:, None] / len(xb)
+
+            grads = [None] * len(params)
+            for i in range(len(params) - 2, -1, -2):
+                grad = grad * (1 - activations[i // 2 + 1] ** 2)
+                grads[i] = activations[i // 2].T @ grad
+                grads[i + 1] = grad.sum(axis=0)
+                grad = grad @ params[i].T
+
+            step += 1
+            for p, g, m, v in zip(params, grads, moments, velocities):
+                m *= 0.9
+                m += 0.1 * g
+                v *= 0.999
+                v += 0.001 * g * g
+                p -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+
+    model = ValueModel(mean, std, [(params[i], params[i + 1]) for i in range(0, len(params), 2)])
+    stats = {
+        "positions": int(len(x)),
+        "hidden": hidden,
+        "epochs": epochs,
+        "validation_mse": float(np.mean((model.predict(x_val) - y_val) ** 2)),
+        "baseline_mse": float(np.mean((y_val - y_train.mean()) ** 2)),
+    }
+    return model, stats
+
+# Benchmarks
+
+def _sample_leaves(count: int, seed: int) -> List[GameState]:
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        engine = GameEngine()
+        for _ in range(rng.randrange(0, 60)):
+            moves = engine.get_valid_moves(engine.state.activePlayer)
+            if engine.state.phase == "GAME_OVER" or not moves:
+                break
+            engine.apply_move(rng.choice(moves))
+        states.append(engine.state)
+    return states
+
+def bench(model: ValueModel, count: int = 4096):
+    from backend.ai_engine import AIEngine
+
+    states = _sample_leaves(count, seed=0)
+    handwritten = AIEngine(evaluation="handwritten")
+    start = time.perf_counter()
+    for state in states:
+        handwritten.evaluate_state(state, "TIGER")
+    scalar = (time.perf_counter() - start) / count
+    print(f"hand-written evaluate_state:        {scalar * 1e6:8.2f} us/leaf")
+
+    for size in (1, 8, 32, 256, 4096):
+        chunks = [states[i:i + size] for i in range(0, count, size)]
+        start = time.perf_counter()
+        for chunk in chunks:
+            model.evaluate_states(chunk, "TIGER")
+        elapsed = (time.perf_counter() - start) / count
+        print(f"learned, batches of {size:<5}         {elapsed * 1e6:8.2f} us/leaf")
+
+    batch = PositionBatch.from_states(states)
+    start = time.perf_counter()
+    model.evaluate(batch, TIGER)
+    print(f"learned, pre-encoded batch of {count}: {(time.perf_counter() - start) / count * 1e6:8.2f} us/leaf")
+
+def play_match(tiger, goat, opening: List, max_plies: int = 200) -> GameState:
+    """Play one game between two AIEngines from the given opening moves; returns the final state."""
+    engine = GameEngine()
+    for move in opening:
+        engine.apply_move(move)
+    for _ in range(max_plies):
+        if engine.state.phase == "GAME_OVER":
+            break
+        player = engine.state.activePlayer
+        move = (tiger if player == "TIGER" else goat).get_best_move(engine.state)
+        if move is None:
+            break
+        engine.apply_move(move)
+    return engine.state
+
+def _random_opening(rng: random.Random, plies: int) -> List:
+    engine = GameEngine()
+    for _ in range(plies):
+        engine.apply_move(rng.choice(engine.get_valid_moves(engine.state.activePlayer)))
+    return engine.moves
+
+def compare(model: ValueModel, openings: int, seed: int = 0):
+    """
+    Learned vs hand-written evaluation at the same search depth, and so the
+    same node budget. From each random opening the hand-written AI plays
+    itself (the baseline), then the learned AI replaces first its tiger and
+    then its goat. Most games between equal searches end in repetition, so
+    captured goats are reported alongside results.
+    """
+    from backend.ai_engine import AIEngine
+
+    # Use `model` rather than whatever weights AI_EVAL_WEIGHTS points at
+    learned = AIEngine(evaluation="handwritten")
+    learned.value_model = model
+    handwritten = AIEngine(evaluation="handwritten")
+    for ai in (learned, handwritten):
+        ai.solver = None
+    rng = random.Random(seed)
+
+    pairings = {
+        "hand-written vs hand-written": (handwritten, handwritten),
+        "learned tiger vs hand-written": (learned, handwritten),
+        "hand-written vs learned goat": (handwritten, learned),
+    }
+    results = {name: {"TIGER": 0, "GOAT": 0, "draw": 0, "captured": 0} for name in pairings}
+    start = time.perf_counter()
+    for index in range(openings):
+        opening = _random_opening(rng, 4)
+        for name, (tiger, goat) in pairings.items():
+            # Reseed the tie-breaking RNGs so every pairing sees the same luck.
+            learned.rng.seed(seed * 100003 + index)
+            handwritten.rng.seed(seed * 100003 + index)
+            final = play_match(tiger, goat, opening)
+            results[name][final.winner or "draw"] += 1
+            results[name]["captured"] += final.goatsKilled
+
+    print(f"{openings} openings, depth 2 ({time.perf_counter() - start:.1f}s)")
+    for name, r in results.items():
+        print(f"  {name:<32} tiger wins {r['TIGER']:>3}  goat wins {r['GOAT']:>3}  draws {r['draw']:>3}  "
+              f"goats captured/game {r['captured'] / openings:.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and benchmark the learned evaluation")
+    parser.add_argument("command", choices=("train", "bench", "compare"))
+    parser.add_argument("--games", type=int, help="Self-play games to train on / openings to compare from")
+    parser.add_argument("--records", help="Train on a game record file instead of self-play")
+    parser.add_argument("--hidden", type=int, default=0, help="Hidden units of the MLP (0: linear model)")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS, help="Weights to benchmark or compare")
+    parser.add_argument("--out", default=DEFAULT_WEIGHTS, help="Where train writes the weights")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        start = time.perf_counter()
+        if args.records:
+            positions, y = record_positions(args.records)
+            source = os.path.basename(args.records)
+        else:
+            games = args.games or 8000
+            positions, y = self_play(games, seed=args.seed)
+            source = f"self-play, {games} games, seed {args.seed}"
+        print(f"{len(positions)} positions from {source} ({time.perf_counter() - start:.1f}s)")
+
+        model, stats = train(value_features(positions), y, hidden=args.hidden, epochs=args.epochs, seed=args.seed)
+        model.version = os.path.splitext(os.path.basename(args.out))[0]
+        model.metadata = dict(stats, source=source)
+        model.save(args.out)
+        print(f"Validation MSE {stats['validation_mse']:.4f} (predicting the mean: {stats['baseline_mse']:.4f})")
+        print(f"Wrote {model.version} to {args.out}")
+    elif args.command == "bench":
+        bench(ValueModel.load(args.weights))
+    else:
+        compare(ValueModel.load(args.weights), args.games or 100, seed=args.seed)
@@ -3,7 +3,7 @@ import axios from 'axios';
 import { onAuthStateChanged, signOut } from 'firebase/auth';
 import { auth } from './firebase';
 import Login from './components/Login';
-import { GameState, Move } from './game/types.ts';
+import { GameState, Move, MoveReply } from './game/types.ts';
 import { Board } from './components/Board';
 import Menu from './components/Menu';
 
@@ -18,6 +18,11 @@ function App() {
   const [user, setUser] = useState<any>(null);
   const wsRef = useRef<WebSocket | null>(null);
   const matchmakingWsRef = useRef<WebSocket | null>(null);
+  // Moves sent over the game socket, keyed by sequence number, until acked.
+  // The session id tells the server this page load restarted seq at 1.
+  const moveSessionRef = useRef(`${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`);
+  const moveSeqRef = useRef(0);
+  const pendingMovesRef = useRef<Map<number, ReturnType<typeof setTimeout>>>(new Map());
 
   useEffect(() => {
     const unsubscribe = onAuthStateChanged(auth, (user) => {
@@ -144,9 +149,13 @@ function App() {
     };
 
     ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type) {
+        handleMoveReply(data as MoveReply);
+        return;
+      }
       console.log("Received update via WebSocket");
-      const newState = JSON.parse(event.data);
-      setGameState(newState);
+      setGameState(data);
     };
 
     ws.onerror = (err) => {
@@ -231,8 +240,49 @@ function App() {
     }
   };
 
+  const handleMoveReply = (reply: MoveReply) => {
+    if (reply.type === "ERROR") {
+      console.error("WebSocket error reply:", reply.detail);
+      return;
+    }
+    const timer = pendingMovesRef.current.get(reply.seq);
+    if (timer === undefined) return; // Duplicate reply to a retried move
+    clearTimeout(timer);
+    pendingMovesRef.current.delete(reply.seq);
+    if (reply.type === "MOVE_REJECTED") {
+      setError(reply.detail || "Invalid move");
+    }
+  };
+
+  const sendMoveOverSocket = (move: Move) => {
+    const seq = ++moveSeqRef.current;
+    const message = JSON.stringify({ type: "MOVE", session: moveSessionRef.current, seq, move });
+
+    // Retrying with the same session and seq is safe, also on a reconnected
+    // socket: the server replays its original reply.
+    const sendWithRetry = (attempt: number) => {
+      const ws = wsRef.current;
+      if (!ws || ws.readyState !== WebSocket.OPEN || attempt > 3) {
+        pendingMovesRef.current.delete(seq);
+        setError("Connection problem, move may not have been sent.");
+        return;
+      }
+      ws.send(message);
+      pendingMovesRef.current.set(seq, setTimeout(() => sendWithRetry(attempt + 1), 2000));
+    };
+    sendWithRetry(1);
+  };
+
   const sendMove = async (move: Move) => {
     if (!gameState) return;
+
+    const ws = wsRef.current;
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      // The new state arrives through the regular broadcast.
+      sendMoveOverSocket(move);
+      return;
+    }
+
     try {
       const response = await axios.post(`/api/games/${gameState.matchId}/move`, move);
       setGameState(response.data);
@@ -20,3 +20,9 @@ export interface Move {
     to_node: number;
     playerId: string;
 }
+
+// Replies to moves submitted over the match websocket
+export type MoveReply =
+    | { type: "MOVE_ACK"; seq: number; ply: number }
+    | { type: "MOVE_REJECTED"; seq: number; status: number; detail: string }
+    | { type: "ERROR"; detail: string };